@@ -0,0 +1,83 @@
+import json
+from pathlib import Path
+
+from scrape_common import normalize_search_text
+
+# 店舗の別名（読みがな・略称）の辞書。正規化した店舗名 → {"name": 表示名, "aliases": [...]}
+# 一度採用した別名は消さずに毎晩引き継ぎ、辞書にない店舗の分だけ Gemini に生成させる
+# 別名は検索にしか使わないので、正規化すると同じになるもの（マクド / まくど など）は最初の1つだけ残す
+ALIAS_FORMAT_VERSION = 1
+
+
+def alias_key(name):
+    return normalize_search_text(name)
+
+
+def load_alias_dictionary(path):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except Exception as e:
+        print(f"WARNING: Could not load alias dictionary {path}: {e}", flush=True)
+        return {}
+    if not isinstance(payload, dict) or payload.get("version") != ALIAS_FORMAT_VERSION:
+        print(f"WARNING: Ignoring alias dictionary {path} (unsupported format)", flush=True)
+        return {}
+    stores = payload.get("stores")
+    return stores if isinstance(stores, dict) else {}
+
+
+def save_alias_dictionary(path, dictionary):
+    with Path(path).open("w", encoding="utf-8", newline="\n") as f:
+        json.dump({"version": ALIAS_FORMAT_VERSION, "stores": dictionary}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def merge_aliases(name, *alias_lists):
+    """前のリストの順番を保ったまま後ろのリストの新しい別名を足す。店舗名自体や正規化して重複するものは除く"""
+    seen = {alias_key(name)}
+    merged = []
+    for aliases in alias_lists:
+        for alias in aliases or []:
+            if not isinstance(alias, str) or not alias.strip():
+                continue
+            key = alias_key(alias)
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(alias.strip())
+    return merged
+
+
+def add_aliases(dictionary, name, aliases):
+    key = alias_key(name)
+    if not key:
+        return []
+    entry = dictionary.setdefault(key, {"name": name, "aliases": []})
+    entry["aliases"] = merge_aliases(name, entry.get("aliases"), aliases)
+    return entry["aliases"]
+
+
+def seed_alias_dictionary(dictionary, stores):
+    # 辞書がまだない最初の実行では、前回の data.json の別名を採用済みとして取り込む
+    for store in stores:
+        if isinstance(store, dict) and store.get("name") and store.get("aliases"):
+            add_aliases(dictionary, store["name"], store["aliases"])
+    return dictionary
+
+
+def apply_alias_dictionary(stores, dictionary):
+    """辞書の別名と今回の別名をマージして stores と辞書の両方に反映し、反映後も別名のない店舗名を返す"""
+    names = {}
+    for store in stores:
+        name = store.get("name")
+        key = alias_key(name)
+        if not key:
+            continue
+        names.setdefault(key, name)
+        if key in dictionary or store.get("aliases"):
+            # 辞書のリストをそのまま渡すと、あとで片方を変えたときにもう片方も変わってしまう
+            store["aliases"] = list(add_aliases(dictionary, name, store.get("aliases")))
+    return [name for key, name in names.items() if not (dictionary.get(key) or {}).get("aliases")]
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import Future
+
+from run_report import span
+
+
+class RequestBatcher:
+    """submit() された依頼を window 秒ためてから handler にまとめて渡す。
+    handler は [(key, payload), ...] を受け取り {key: 結果} を返す。結果のないキーの Future は None で完了する"""
+
+    def __init__(self, handler, window=3.0, max_size=0):
+        self.handler = handler
+        self.window = window
+        # payload の size の合計の上限（0 以下で無制限）。超える分は次のバッチに回す
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+
+    def submit(self, key, payload, size=0):
+        future = Future()
+        full = None
+        with self._lock:
+            if self._pending and self.max_size > 0 and self._pending_size + size > self.max_size:
+                full = self._take()
+            self._pending.append((key, payload, future))
+            self._pending_size += size
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            # 上限を超えた分は依頼したスレッドを止めずに送る
+            threading.Thread(target=self._run, args=(full,), daemon=True).start()
+        return future
+
+    def _take(self):
+        batch = self._pending
+        self._pending = []
+        self._pending_size = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch):
+        try:
+            with span("batch", tasks=len(batch)):
+                results = self.handler([(key, payload) for key, payload, _ in batch])
+        except Exception as e:
+            print(f"WARNING: Batched request failed ({e}); falling back to single requests", flush=True)
+            results = {}
+        for key, _, future in batch:
+            future.set_result(results.get(key))
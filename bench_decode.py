@@ -0,0 +1,65 @@
+import sys
+import time
+from pathlib import Path
+
+from scrape_common import _decode_bytes_full, decode_bytes
+
+# html_cache のキャッシュを様々なエンコーディングに変換して、段階的デコードと従来方式を比較する
+ROOT_DIR = Path(__file__).resolve().parent
+CACHE_DIRS = (ROOT_DIR / "html_cache",)
+REPEAT = 5
+
+
+def fixtures():
+    # (ラベル, バイト列, ヘッダー, 正しいデコード結果)
+    for cache_dir in CACHE_DIRS:
+        for path in sorted(cache_dir.glob("*.html")):
+            raw = path.read_bytes()
+            text = raw.decode("utf-8")
+            label = path.relative_to(ROOT_DIR)
+            yield f"{label} utf-8", raw, {"content-type": "text/html"}, text
+            yield f"{label} utf-8 (charset header)", raw, {"content-type": "text/html; charset=UTF-8"}, text
+            for encoding in ("cp932", "euc_jp"):
+                encoded = text.encode(encoding, errors="replace")
+                yield f"{label} {encoding}", encoded, {"content-type": "text/html"}, encoded.decode(encoding)
+            mojibake = text.encode("utf-8").decode("latin-1").encode("utf-8")
+            yield f"{label} utf-8 mojibake", mojibake, {"content-type": "text/html"}, text
+
+
+def best_time(func, raw, headers):
+    best = float("inf")
+    result = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = func(raw, headers)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    regressions = 0
+    total_fast = total_full = 0.0
+    print(f"{'fixture':<58} {'bytes':>8} {'full ms':>9} {'staged ms':>10} {'speedup':>8} output")
+    for label, raw, headers, source in fixtures():
+        full_time, expected = best_time(_decode_bytes_full, raw, headers)
+        fast_time, actual = best_time(decode_bytes, raw, headers)
+        if actual == expected:
+            verdict = "identical"
+        elif actual == source:
+            # 従来方式が誤判定していたケース
+            verdict = "improved"
+        else:
+            verdict = "REGRESSED"
+            regressions += 1
+        total_full += full_time
+        total_fast += fast_time
+        print(
+            f"{str(label):<58} {len(raw):>8} {full_time * 1000:>9.2f} {fast_time * 1000:>10.2f} "
+            f"{full_time / fast_time:>7.1f}x {verdict}"
+        )
+    print(f"TOTAL full={total_full * 1000:.1f}ms staged={total_fast * 1000:.1f}ms speedup={total_full / total_fast:.1f}x")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
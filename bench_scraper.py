@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import functools
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+from unittest import mock
+
+from google.genai.errors import APIError
+
+import gemini_client
+import local_updater
+import run_report
+import scraper
+from scrape_common import decode_bytes, polite_get
+
+# html_cache のページ（と本文を N 倍に水増ししたページ）を使い、ネットワークも Gemini も使わずに
+# デコード → クリーニング → キャッシュ読み込み → 抽出までの処理時間・メモリを計測する
+#   python bench_scraper.py --json logs/bench_before.json
+#   python bench_scraper.py --compare logs/bench_before.json
+ROOT_DIR = Path(__file__).resolve().parent
+CACHE_DIR = ROOT_DIR / "html_cache"
+CARDS = ("SMBC", "MUFG")
+SCALES = (1, 10, 100)
+STAGES = ("decode", "clean", "updater_clean", "cache_only", "extract_cold", "extract_warm")
+HTML_HEADERS = {"content-type": "text/html; charset=UTF-8"}
+STREAM_CHUNK_CHARS = 400
+
+
+class StubResponse:
+    def __init__(self, text, prompt_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = mock.Mock(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+
+
+class StubModels:
+    """genai.Client().models の代わり。latency 秒待ってから、プロンプトの長さに応じた件数のストアを返す"""
+
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        # N 回に1回 429 を返す（0 なら返さない）
+        self.fail_every = fail_every
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self.generate_content(model, contents, config)
+        # 実際のストリーミングに近いよう、数百文字ずつに分けて返す
+        for start in range(0, len(response.text), STREAM_CHUNK_CHARS):
+            yield StubResponse(response.text[start:start + STREAM_CHUNK_CHARS], 0, 0)
+
+    def generate_content(self, model, contents, config=None):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.latency)
+        if self.fail_every and call % self.fail_every == 0:
+            raise APIError(429, {"error": {
+                "code": 429,
+                "status": "RESOURCE_EXHAUSTED",
+                "message": "stub rate limit",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0s"}],
+            }})
+        prompt = str(contents)
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        items = [
+            {
+                "name": f"ベンチ店舗{seed}-{i}",
+                "group": None,
+                "aliases": [f"べんち{i}"],
+                "conditions": {"payment_method": "スマホタッチ決済のみ", "mobile_order": "対象外", "delivery": "対象外", "note": ""},
+                "official_list_url": None,
+            }
+            for i in range(max(1, len(prompt) // 2000))
+        ]
+        text = json.dumps(items, ensure_ascii=False)
+        return StubResponse(text, gemini_client.estimate_tokens(prompt), gemini_client.estimate_tokens(text))
+
+
+class StubClient:
+    def __init__(self, latency=0.0, fail_every=0):
+        self.models = StubModels(latency, fail_every)
+
+
+class StubHttpResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.headers = dict(HTML_HEADERS)
+
+    def iter_content(self, chunk_size=1):
+        yield self.content
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+
+class StubSession:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        return StubHttpResponse(self.pages[url])
+
+
+def enlarge(raw, scale):
+    # <body> の中身を scale 回繰り返す（見つからなければページ全体を繰り返す）
+    if scale == 1:
+        return raw
+    start = raw.find(b">", raw.find(b"<body")) + 1
+    end = raw.rfind(b"</body>")
+    if start <= 0 or end < start:
+        return raw * scale
+    return raw[:start] + raw[start:end] * scale + raw[end:]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+@contextlib.contextmanager
+def stubbed(workdir, pages, latency, fail_every):
+    # scraper の出力先・HTTP・Gemini をすべて作業ディレクトリとスタブに差し替える
+    patches = (
+        (scraper, "ROOT_DIR", workdir),
+        (scraper, "CACHE_DIR", workdir / "html_cache"),
+        (scraper, "DATA_FILE", workdir / "data.json"),
+        (scraper, "EXTRACT_CACHE_FILE", workdir / "extract_cache.json"),
+        (scraper, "SESSION", StubSession(pages)),
+        (scraper, "polite_get", functools.partial(polite_get, min_interval=0)),
+        (gemini_client, "_client", StubClient(latency, fail_every)),
+        (gemini_client, "limiter", gemini_client.RateLimiter(0, 0)),
+    )
+    with contextlib.ExitStack() as stack:
+        for target, name, value in patches:
+            stack.enter_context(mock.patch.object(target, name, value))
+        yield
+
+
+def stage_runner(stage, card, url, raw, workdir):
+    if stage == "decode":
+        return lambda: decode_bytes(raw, HTML_HEADERS)
+    if stage == "clean":
+        text = decode_bytes(raw, HTML_HEADERS)
+        return lambda: scraper.clean_html_aggressive(text, card)
+    if stage == "updater_clean":
+        text = decode_bytes(raw, HTML_HEADERS)
+        return lambda: local_updater.clean_html_aggressive(text)
+    if stage == "cache_only":
+        def run():
+            document, _ = scraper.get_source_html(card, url, cache_only=True)
+            return document and document.useful
+        return run
+    if stage == "extract_cold":
+        def run():
+            (workdir / "extract_cache.json").unlink(missing_ok=True)
+            (workdir / "html_cache" / "index.json").unlink(missing_ok=True)
+            return scraper.fetch_and_extract(card, url)
+        return run
+    # extract_warm: 直前の抽出キャッシュと本文ハッシュが一致して Gemini を呼ばない経路
+    scraper.fetch_and_extract(card, url)
+    return lambda: scraper.fetch_and_extract(card, url)
+
+
+def measure(prepare, repeat, quiet):
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        run = prepare()
+        durations = []
+        for _ in range(repeat):
+            run_report.reset()
+            started = time.perf_counter()
+            run()
+            durations.append(time.perf_counter() - started)
+        # メモリは tracemalloc で遅くなるので、時間計測とは別に1回だけ測る
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return durations, peak
+
+
+def run_benchmarks(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales:
+            workdir = Path(tmp) / f"x{scale}"
+            (workdir / "html_cache").mkdir(parents=True)
+            pages = {}
+            for card in args.cards:
+                raw = enlarge((CACHE_DIR / f"{card}.html").read_bytes(), scale)
+                (workdir / "html_cache" / f"{card}.html").write_bytes(raw)
+                pages[scraper.URLS[card]] = raw
+
+            with stubbed(workdir, pages, args.latency, args.fail_every):
+                for card in args.cards:
+                    url = scraper.URLS[card]
+                    raw = pages[url]
+                    for stage in args.stages:
+                        prepare = functools.partial(stage_runner, stage, card, url, raw, workdir)
+                        durations, peak = measure(prepare, args.repeat, not args.verbose)
+                        best = min(durations)
+                        results[f"{stage} {card} x{scale}"] = {
+                            "bytes": len(raw),
+                            "p50": percentile(durations, 0.5),
+                            "p90": percentile(durations, 0.9),
+                            "max": max(durations),
+                            "mb_per_s": len(raw) / best / 1e6 if best else 0.0,
+                            "peak_bytes": peak,
+                        }
+    calls = gemini_client.call_stats()["per_call"]
+    latencies = [call["latency"] for call in calls]
+    gemini = {
+        "calls": len(calls),
+        "rate_limited": sum(call["rate_limited"] for call in calls),
+        "p50": percentile(latencies, 0.5) if latencies else 0.0,
+        "p95": percentile(latencies, 0.95) if latencies else 0.0,
+    }
+    return {"results": results, "gemini": gemini}
+
+
+def print_report(report, baseline=None):
+    previous = (baseline or {}).get("results", {})
+    header = f"{'case':<28} {'bytes':>10} {'p50 ms':>9} {'p90 ms':>9} {'max ms':>9} {'MB/s':>8} {'peak KiB':>10}"
+    print(header + ("  vs baseline" if baseline else ""))
+    for case, row in report["results"].items():
+        line = (
+            f"{case:<28} {row['bytes']:>10} {row['p50'] * 1000:>9.2f} {row['p90'] * 1000:>9.2f} "
+            f"{row['max'] * 1000:>9.2f} {row['mb_per_s']:>8.2f} {row['peak_bytes'] / 1024:>10.1f}"
+        )
+        if case in previous and row["p50"]:
+            line += f"  {previous[case]['p50'] / row['p50']:.2f}x"
+        print(line)
+    gemini = report["gemini"]
+    print(
+        f"GEMINI (stub) calls={gemini['calls']} rate_limited={gemini['rate_limited']} "
+        f"p50={gemini['p50'] * 1000:.1f}ms p95={gemini['p95'] * 1000:.1f}ms"
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline scraper benchmark over html_cache fixtures")
+    parser.add_argument("--cards", nargs="+", default=list(CARDS), choices=CARDS)
+    parser.add_argument("--scales", nargs="+", type=int, default=list(SCALES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub Gemini latency in seconds")
+    parser.add_argument("--fail-every", type=int, default=0, help="return 429 on every Nth stub call")
+    parser.add_argument("--json", type=Path, help="write results to this file")
+    parser.add_argument("--compare", type=Path, help="show p50 speedup against a previous --json file")
+    parser.add_argument("--verbose", action="store_true", help="keep the scraper's own log output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+    report = run_benchmarks(args)
+    report["args"] = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    print_report(report, baseline)
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import json
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from scrape_common import content_hash
+
+# html_cache/ の中身と、その出どころを index.json に記録する（local_updater が書き、scraper が読む）
+# entries[カード]:
+#   url / fetched_at / encoding / source_hash:  取得したページと、その生のバイト列のハッシュ
+#   etag / last_modified:                       次回の条件付きリクエスト用
+#   file / file_hash / cleaner / chars:         保存した軽量化済み HTML と、使ったクリーナーのバージョン
+#   extract:                                    同じ取得分から作った Gemini 用テキスト（file / hash / cleaner / valid / chars）
+# file_hash・hash が実際のファイルと一致するときだけ信用する（手で差し替えたファイルは再クリーニングされる）
+# validators[URL]: scraper が直接取得したページ（公式・リファラル）の条件付きリクエスト用
+#   etag / last_modified / body_hash / fetched_at
+#   entries とは別に持つ。entries の etag は保存した HTML のもので、scraper の取得では HTML を書き換えないため
+CACHE_FORMAT_VERSION = 1
+INDEX_NAME = "index.json"
+
+
+class CacheStore:
+    # scraper は取得ごとに CacheStore を作るので、index.json の読み書きはインスタンスをまたいで直列化する
+    _lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @property
+    def index_path(self):
+        return self.directory / INDEX_NAME
+
+    def html_path(self, card_name):
+        return self.directory / f"{card_name}.html"
+
+    def _load(self, section="entries"):
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"WARNING: Could not load cache index {self.index_path}: {e}", flush=True)
+            return {}
+        if not isinstance(index, dict) or index.get("version") != CACHE_FORMAT_VERSION:
+            print(f"WARNING: Ignoring cache index {self.index_path} (unsupported format)", flush=True)
+            return {}
+        entries = index.get(section)
+        return entries if isinstance(entries, dict) else {}
+
+    def _update(self, section, key, value):
+        # 呼び出し側で self._lock を取っておく。もう一方のセクションはそのまま書き戻す
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = {"version": CACHE_FORMAT_VERSION, "entries": self._load("entries"), "validators": self._load("validators")}
+        index[section][key] = value
+        with self.index_path.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def entry(self, card_name):
+        with self._lock:
+            return dict(self._load().get(card_name) or {})
+
+    def validators(self, url):
+        """scraper が前回 url を取得したときの etag / last_modified / body_hash"""
+        with self._lock:
+            return dict(self._load("validators").get(url) or {})
+
+    def record_validators(self, url, response):
+        # 次回の条件付きリクエスト用に ETag / Last-Modified と本文のハッシュを保存する
+        entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": content_hash(response.content),
+            "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            try:
+                self._update("validators", url, entry)
+            except OSError as e:
+                print(f"WARNING: Could not write cache index {self.index_path}: {e}", flush=True)
+        return entry
+
+    def save(self, card_name, html_text, extract=None, **source):
+        """軽量化済み HTML と（あれば）Gemini 用テキストを書き、index.json の card_name の項目を置き換える
+        source: url / encoding / source_hash / etag / last_modified / cleaner
+        extract: {"text": ..., "cleaner": ..., "valid": ...}"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = html_text.encode("utf-8")
+        self.html_path(card_name).write_bytes(data)
+        entry = {
+            **source,
+            "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "file": self.html_path(card_name).name,
+            "file_hash": content_hash(data),
+            "chars": len(html_text),
+        }
+        if extract is not None:
+            path = self.directory / f"{card_name}.extract.txt"
+            text = extract["text"]
+            path.write_bytes(text.encode("utf-8"))
+            entry["extract"] = {
+                "file": path.name,
+                "hash": content_hash(text),
+                "cleaner": extract["cleaner"],
+                "valid": bool(extract["valid"]),
+                "chars": len(text),
+            }
+        with self._lock:
+            self._update("entries", card_name, entry)
+        return entry
+
+    def is_current(self, card_name, cleaner, extract_cleaner=None):
+        """保存済みの HTML（と extract_cleaner を渡せば Gemini 用テキスト）が今のクリーナーで作られ、改変されていないか"""
+        entry = self.entry(card_name)
+        if entry.get("cleaner") != cleaner:
+            return False
+        try:
+            if content_hash(self.html_path(card_name).read_bytes()) != entry.get("file_hash"):
+                return False
+        except OSError:
+            return False
+        return extract_cleaner is None or self._read_extract(entry, extract_cleaner) is not None
+
+    def trusted_extract(self, card_name, extract_cleaner, file_hash=None, source_hash=None):
+        """file_hash（保存済み HTML）か source_hash（取得した生のページ）が記録と一致し、
+        同じクリーナーで作った Gemini 用テキストがあれば (テキスト, 検証結果) を返す。なければ None"""
+        entry = self.entry(card_name)
+        if file_hash is not None and entry.get("file_hash") != file_hash:
+            return None
+        if source_hash is not None and entry.get("source_hash") != source_hash:
+            return None
+        if file_hash is None and source_hash is None:
+            return None
+        return self._read_extract(entry, extract_cleaner)
+
+    def _read_extract(self, entry, extract_cleaner):
+        extract = entry.get("extract") or {}
+        if not extract.get("file") or extract.get("cleaner") != extract_cleaner:
+            return None
+        try:
+            text = (self.directory / extract["file"]).read_bytes().decode("utf-8")
+        except (OSError, UnicodeError):
+            return None
+        if content_hash(text) != extract.get("hash"):
+            return None
+        return text, bool(extract.get("valid"))
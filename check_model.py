@@ -1,8 +1,8 @@
 import os
-from google import genai
+
+from gemini_client import call_stats, generate
 
 def check_model_config():
-    api_key = os.environ.get("GEMINI_API_KEY")
     # GitHub Actions変数で設定されたID、またはデフォルト
     target_model = os.environ.get("GEMINI_MODEL_ID", "gemini-flash-latest")
     
@@ -10,15 +10,12 @@ def check_model_config():
     print(f"⚙️  Configured Model ID: {target_model}")
     print("-" * 30)
 
-    client = genai.Client(api_key=api_key)
-    
     try:
         # 疎通確認
-        response = client.models.generate_content(
-            model=target_model,
-            contents="PING"
-        )
+        response = generate("PING", target_model, label="health check", max_attempts=2)
+        stats = call_stats()
         print("✅ API Connection: Success")
+        print(f"⏱️  Latency: {stats['latency_max']:.2f}s (retries: {stats['retries']})")
         print(f"💬 Response: {response.text.strip()}")
         
         if "gemini-3" in target_model:
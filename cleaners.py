@@ -0,0 +1,117 @@
+import re
+
+from html_select import SECTION_SELECTORS, select_text
+
+# html_cache/ に保存する HTML の軽量化（local_updater）と、Gemini に渡すテキストの抽出（scraper）
+# 出力が変わる修正をしたらバージョンを上げる（cache_store の index.json に記録した成果物が使われなくなる）
+CACHE_CLEANER_VERSION = "2"
+EXTRACT_CLEANER_VERSION = "1"
+
+# 旧実装は属性・タグごとに re.sub を30回近く繰り返していた。ブロック削除とコメント削除はこの順で先に行う
+# （コメントの中のブロックタグ・ブロックの中のコメントの扱いを旧実装と同じにするため）。
+# 残りの「リンク以外の属性削除 → 指定属性の削除 → 指定タグの除去」は1つのパターンにまとめて1回で書き換える
+STRIP_TAGS = ("div", "span", "section", "article", "main", "body", "html", "head")
+BLOCK_RE = re.compile(r"<(header|footer|nav|noscript|script|style|iframe|svg|aside)[^>]*>.*?</\1>", re.DOTALL | re.IGNORECASE)
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+CLEAN_RE = re.compile(
+    r"<(?P<tag>(?!a\s)[a-z0-9]+)\s+[^>]*>"
+    r"|<(?:" + "|".join(STRIP_TAGS) + r")[^>]*>"
+    r"|</(?P<close>" + "|".join(STRIP_TAGS) + r")>"
+    r"""|\s+(?:class|id|style|target|rel|onclick|data-[a-z0-9-]+|aria-[a-z-]+|role)(?:="[^"]*"|='[^']*')""",
+    re.DOTALL | re.IGNORECASE,
+)
+WHITESPACE_RE = re.compile(r"(\n)\n+|( ) +")
+
+
+def extract_cleaner_id(card_name):
+    # セレクターを変えても抽出結果が変わるので、バージョンと一緒に記録する
+    return f"{EXTRACT_CLEANER_VERSION}:{SECTION_SELECTORS.get(card_name) or 'trafilatura'}"
+
+
+def clean_cache_html(html_text):
+    """html_cache/ に保存する軽量化した HTML"""
+    if not html_text: return ""
+    html_text = COMMENT_RE.sub("", BLOCK_RE.sub("", html_text))
+    pieces = []
+    pos = 0
+    # pieces[run_floor:] は直前の空白の並び（属性削除の \s+ に含まれる）。タグが間にあればそこで途切れる
+    run_floor = 0
+    for match in CLEAN_RE.finditer(html_text):
+        text = html_text[pos:match.start()]
+        pos = match.end()
+        if text:
+            if not text.isspace():
+                run_floor = len(pieces)
+            pieces.append(text)
+        tag = match.group("tag")
+        if tag:
+            # 属性を落としたタグが除去対象（div など、前方一致）ならタグごと消す
+            if not tag.lower().startswith(STRIP_TAGS):
+                pieces.append(f"<{tag}>")
+            run_floor = len(pieces)
+        elif match.group("close"):
+            pieces.append("\n")
+            run_floor = len(pieces)
+        elif match.group().startswith("<"):
+            run_floor = len(pieces)
+        else:
+            # 属性の削除。手前の空白もまとめて消す
+            while len(pieces) > run_floor:
+                stripped = pieces[-1].rstrip()
+                if stripped:
+                    pieces[-1] = stripped
+                    break
+                pieces.pop()
+            run_floor = len(pieces)
+    pieces.append(html_text[pos:])
+
+    html_text = WHITESPACE_RE.sub(r"\1\2", "".join(pieces))
+    html_text = "\n".join(line.rstrip() for line in html_text.splitlines())
+    return html_text[:95000].strip() + "\n"
+
+
+def clean_extract_text(html_text, card_name=""):
+    """
+    trafilatura を使ってHTMLからメインコンテンツを抽出
+    SECTION_SELECTORS にセレクターがあるカード（MUFGの#anc01など）は、その部分のテキストを直接返す
+    """
+    if not html_text:
+        return ""
+
+    selector = SECTION_SELECTORS.get(card_name)
+    if selector:
+        try:
+            section_text = select_text(html_text, selector)
+            if section_text:
+                print(f"DEBUG: {card_name} {selector} extracted ({len(section_text)} chars)", flush=True)
+                return section_text
+        except Exception as e:
+            print(f"WARNING: {card_name} CSS selector extraction failed: {e}", flush=True)
+
+    # trafilatura は読み込みに時間がかかるので、セレクターで取れなかったときだけ import する
+    try:
+        import trafilatura
+    except ImportError:
+        raise RuntimeError("trafilatura is not installed") from None
+
+    # trafilatura でメインコンテンツを抽出（テキスト形式）
+    extracted = trafilatura.extract(
+        html_text,
+        output_format="txt",
+        include_tables=True,
+        include_links=True,
+        no_fallback=False
+    )
+
+    if not extracted:
+        # フォールバック: 元の正規表現ベースのクリーニング
+        print("WARNING: trafilatura extraction failed, using regex fallback", flush=True)
+        blocks_to_kill = r'<(header|footer|nav|noscript|script|style|iframe|svg|aside)[^>]*>.*?</\1>'
+        html_text = re.sub(blocks_to_kill, '', html_text, flags=re.DOTALL | re.IGNORECASE)
+        html_text = re.sub(r'<((?!a\s)[a-z0-9]+)\s+[^>]*>', r'<\1>', html_text, flags=re.IGNORECASE)
+        html_text = re.sub(r'\n+', '\n', html_text)
+        html_text = re.sub(r' +', ' ', html_text)
+        return html_text.strip()
+
+    # 長いページは fetch_and_extract がセクションに分けて抽出するので、ここでは切り詰めない
+    return extracted.strip()
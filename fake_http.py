@@ -0,0 +1,21 @@
+"""テスト用の requests.Response の代わり"""
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        self.read += 1
+        yield self.content
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"{self.status_code} Server Error")
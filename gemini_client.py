@@ -0,0 +1,307 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from run_report import count, span
+
+# --- Configuration ---
+API_KEY = os.environ.get("GEMINI_API_KEY")
+# モデルのクォータに合わせる（0 以下で無制限）
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", "10"))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", "250000"))
+# Gemini への同時リクエスト数の上限（全カード共通）
+GEMINI_CONCURRENCY = int(os.environ.get("GEMINI_CONCURRENCY", "2"))
+MAX_ATTEMPTS = 5
+# 429 はサーバーの指示がなければ長めに、タイムアウト等は短めに待つ
+RATE_LIMIT_BACKOFF = 10.0
+ERROR_BACKOFF = 2.0
+MAX_BACKOFF = 120.0
+# タイムアウト180秒
+REQUEST_TIMEOUT_MS = 180000
+
+DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+_client = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(GEMINI_CONCURRENCY)
+_stats_lock = threading.Lock()
+_calls = []
+
+
+class GeminiError(Exception):
+    pass
+
+
+class RateLimiter:
+    """RPM / TPM の2つのトークンバケット。429 を受けたら全スレッドをまとめて止める"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._requests = max(rpm, 0)
+        self._tokens = max(tpm, 0)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm > 0:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm > 0:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, now, tokens):
+        waits = [self._paused_until - now]
+        if self.rpm > 0:
+            waits.append((1 - self._requests) * 60 / self.rpm)
+        if self.tpm > 0:
+            waits.append((min(tokens, self.tpm) - self._tokens) * 60 / self.tpm)
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    if self.rpm > 0:
+                        self._requests -= 1
+                    if self.tpm > 0:
+                        self._tokens -= min(tokens, self.tpm)
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client:
+            return _client
+        if not API_KEY:
+            print("FATAL ERROR: 'GEMINI_API_KEY' environment variable is missing.", flush=True)
+            sys.exit(1)
+
+        # google-genai は読み込みに時間がかかるので、実際に Gemini を呼ぶときまで import しない
+        from google import genai
+        from google.genai import types
+
+        _client = genai.Client(
+            api_key=API_KEY,
+            http_options=types.HttpOptions(timeout=REQUEST_TIMEOUT_MS)
+        )
+        return _client
+
+
+def estimate_tokens(text):
+    # 日本語混じりの文章はおよそ2文字で1トークン
+    return max(1, len(text or "") // 2)
+
+
+def _genai_errors():
+    # google-genai がまだ読み込まれていなければ、その例外が発生していることもない
+    return sys.modules.get("google.genai.errors")
+
+
+def is_rate_limited(error):
+    errors = _genai_errors()
+    if errors is not None and isinstance(error, errors.APIError) and error.code == 429:
+        return True
+    return "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def _parse_seconds(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DURATION_RE.match(str(value))
+    if match:
+        return float(match.group(1))
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _find_retry_delay(details):
+    if isinstance(details, dict):
+        if "retryDelay" in details:
+            return _parse_seconds(details["retryDelay"])
+        values = details.values()
+    elif isinstance(details, list):
+        values = details
+    else:
+        return None
+    for value in values:
+        delay = _find_retry_delay(value)
+        if delay is not None:
+            return delay
+    return None
+
+
+def retry_hint(error):
+    """Retry-After ヘッダーか google.rpc.RetryInfo の retryDelay から待ち秒数を取り出す"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        delay = _parse_seconds(headers.get("retry-after") or headers.get("Retry-After"))
+    except AttributeError:
+        delay = None
+    if delay is not None:
+        return delay
+    return _find_retry_delay(getattr(error, "details", None))
+
+
+def backoff_delay(attempt, base):
+    # equal jitter: 同時に失敗したリクエストが同じタイミングで再送しないようにずらす
+    ceiling = min(MAX_BACKOFF, base * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def _record(label, latency, attempts, rate_limited, errors, ok):
+    with _stats_lock:
+        _calls.append({
+            "label": label,
+            "latency": latency,
+            "attempts": attempts,
+            "rate_limited": rate_limited,
+            "errors": errors,
+            "ok": ok,
+        })
+
+
+def call_stats():
+    with _stats_lock:
+        calls = list(_calls)
+    latencies = sorted(call["latency"] for call in calls)
+    return {
+        "calls": len(calls),
+        "failed": sum(1 for call in calls if not call["ok"]),
+        "retries": sum(call["attempts"] - 1 for call in calls),
+        "rate_limited": sum(call["rate_limited"] for call in calls),
+        "errors": sum(call["errors"] for call in calls),
+        "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_max": latencies[-1] if latencies else 0.0,
+        "per_call": calls,
+    }
+
+
+def _failure_delay(error, attempt, label):
+    """失敗を分類して (待ち秒数, 429 かどうか) を返す。リトライしない 4xx は待ち秒数が None"""
+    if is_rate_limited(error):
+        hint = retry_hint(error)
+        delay = hint + random.uniform(0, 1) if hint is not None else backoff_delay(attempt, RATE_LIMIT_BACKOFF)
+        # 他のスレッドも同じクォータを使っているのでまとめて止める
+        limiter.pause(delay)
+        print(f"WARNING: Rate Limit (429) for {label}. Retrying in {delay:.1f}s...", flush=True)
+        return delay, True
+    errors = _genai_errors()
+    if errors is not None and isinstance(error, errors.ClientError):
+        print(f"CRITICAL API ERROR: {error}", flush=True)
+        return None, False
+    delay = backoff_delay(attempt, ERROR_BACKOFF)
+    print(f"WARNING: Network/Timeout Error for {label} ({error}). Retrying in {delay:.1f}s...", flush=True)
+    return delay, False
+
+
+def _record_usage(record, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        record["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or 0
+        record["output_tokens"] = getattr(usage, "candidates_token_count", None) or 0
+
+
+def generate(prompt, model, config=None, label="gemini", max_attempts=MAX_ATTEMPTS):
+    """レート制限とリトライ付きで generate_content を呼び、レスポンスを返す。失敗時は GeminiError"""
+    started = time.monotonic()
+    rate_limited = 0
+    errors = 0
+    tokens = estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+
+    for attempt in range(max_attempts):
+        waited = limiter.acquire(tokens)
+        if waited:
+            count("gemini_limiter_wait_seconds", round(waited, 4))
+        try:
+            print(f"DEBUG: Requesting Gemini for {label}... (Attempt {attempt+1})", flush=True)
+            with _slots, span("gemini_call", label=label, attempt=attempt + 1, prompt_chars=len(str(prompt))) as record:
+                response = get_client().models.generate_content(model=model, contents=prompt, config=config)
+                record["prompt_tokens"] = record["output_tokens"] = 0
+                _record_usage(record, response)
+            _record(label, time.monotonic() - started, attempt + 1, rate_limited, errors, True)
+            return response
+        except Exception as e:
+            delay, limited = _failure_delay(e, attempt, label)
+            rate_limited += limited
+            errors += not limited
+            if delay is None:
+                _record(label, time.monotonic() - started, attempt + 1, rate_limited, errors, False)
+                raise GeminiError("Gemini API client error") from e
+            if attempt < max_attempts - 1:
+                with span("retry_sleep", label=label, attempt=attempt + 1):
+                    time.sleep(delay)
+
+    _record(label, time.monotonic() - started, max_attempts, rate_limited, errors, False)
+    raise GeminiError("Gemini request failed after retries")
+
+
+def generate_stream(prompt, model, config=None, label="gemini", max_attempts=MAX_ATTEMPTS):
+    """generate_content_stream のテキストを届いた順に返すジェネレーター。
+    リトライするのは最初のテキストが届く前の失敗だけで、途中で切れた場合は GeminiError"""
+    started = time.monotonic()
+    rate_limited = 0
+    errors = 0
+    tokens = estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+
+    for attempt in range(max_attempts):
+        waited = limiter.acquire(tokens)
+        if waited:
+            count("gemini_limiter_wait_seconds", round(waited, 4))
+        received = False
+        try:
+            print(f"DEBUG: Streaming Gemini for {label}... (Attempt {attempt+1})", flush=True)
+            with _slots, span("gemini_call", label=label, attempt=attempt + 1, prompt_chars=len(str(prompt)), stream=True) as record:
+                record["prompt_tokens"] = record["output_tokens"] = 0
+                for chunk in get_client().models.generate_content_stream(model=model, contents=prompt, config=config):
+                    _record_usage(record, chunk)
+                    text = getattr(chunk, "text", None)
+                    if text:
+                        if not received:
+                            record["first_chunk"] = round(time.monotonic() - started, 4)
+                        received = True
+                        yield text
+            _record(label, time.monotonic() - started, attempt + 1, rate_limited, errors, True)
+            return
+        except Exception as e:
+            if received:
+                # 届いた分は呼び出し側が使っているので、最初からやり直さない
+                errors += 1
+                print(f"WARNING: Gemini stream for {label} was interrupted ({e})", flush=True)
+                _record(label, time.monotonic() - started, attempt + 1, rate_limited, errors, False)
+                raise GeminiError("Gemini stream was interrupted") from e
+            delay, limited = _failure_delay(e, attempt, label)
+            rate_limited += limited
+            errors += not limited
+            if delay is None:
+                _record(label, time.monotonic() - started, attempt + 1, rate_limited, errors, False)
+                raise GeminiError("Gemini API client error") from e
+            if attempt < max_attempts - 1:
+                with span("retry_sleep", label=label, attempt=attempt + 1):
+                    time.sleep(delay)
+
+    _record(label, time.monotonic() - started, max_attempts, rate_limited, errors, False)
+    raise GeminiError("Gemini request failed after retries")
@@ -0,0 +1,280 @@
+import argparse
+import json
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from scrape_common import normalize_search_text, store_key
+from search_index import stores_hash
+
+# 毎回の data.json を SQLite に積み上げる履歴（「いつ SMBC の対象に入った / 外れた / 条件が変わったか」を
+# git の履歴をたどらずに引けるようにする）
+#   runs:     実行1回につき1行。meta と店舗の並び（layout）は前回から変わったときだけ入れ、変わらなければ NULL
+#   stores:   scrape_common.store_key（カード, 正規化した店舗名, 正規化したグループ名）ごとに1行
+#   versions: 店舗の内容が前回から変わった実行にだけ1行（record が NULL なら一覧から消えた）
+# どの実行の時点の一覧も「その実行以前で最新の version」から組み立てられる
+#   python history.py timeline セブン-イレブン --card SMBC
+#   python history.py diff 10 12
+#   python history.py export --run 12 > data.json
+#   python history.py import-git   # history.sqlite3 がないとき、git の data.json の履歴から作り直す
+ROOT_DIR = Path(__file__).resolve().parent
+HISTORY_FILE = ROOT_DIR / "history.sqlite3"
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_at TEXT NOT NULL,
+    source TEXT,
+    meta TEXT,
+    layout TEXT
+);
+CREATE TABLE IF NOT EXISTS stores (
+    id INTEGER PRIMARY KEY,
+    card_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    group_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (card_type, key, group_key)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    store_id INTEGER NOT NULL REFERENCES stores (id),
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    record TEXT,
+    PRIMARY KEY (store_id, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS versions_by_run ON versions (run_id);
+"""
+# 各店舗の、指定した実行以前で最新の version
+STATE_SQL = """
+SELECT stores.id, stores.card_type, stores.name, versions.record
+FROM versions JOIN stores ON stores.id = versions.store_id
+WHERE versions.run_id = (
+    SELECT MAX(run_id) FROM versions AS latest WHERE latest.store_id = versions.store_id AND latest.run_id <= ?
+)
+"""
+
+
+def canonical(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def changed_fields(before, after):
+    return sorted(field for field in set(before) | set(after) if before.get(field) != after.get(field))
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_FILE):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(self.path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise RuntimeError(f"{self.path} has unsupported schema version {version}")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def latest_run(self):
+        return self.connection.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+
+    def runs(self):
+        rows = self.connection.execute(
+            "SELECT runs.id, runs.run_at, runs.source, COUNT(versions.run_id) FROM runs "
+            "LEFT JOIN versions ON versions.run_id = runs.id GROUP BY runs.id ORDER BY runs.id"
+        )
+        return [{"run": run_id, "run_at": run_at, "source": source, "changes": changes} for run_id, run_at, source, changes in rows]
+
+    def has_source(self, source):
+        return self.connection.execute("SELECT 1 FROM runs WHERE source = ?", (source,)).fetchone() is not None
+
+    def state(self, run_id):
+        """run_id の時点で一覧にあった店舗 {店舗ID: (カード, 店舗名, 内容)}"""
+        return {
+            store_id: (card_type, name, json.loads(record))
+            for store_id, card_type, name, record in self.connection.execute(STATE_SQL, (run_id,))
+            if record is not None
+        }
+
+    def _latest_column(self, column, run_id):
+        row = self.connection.execute(
+            f"SELECT {column} FROM runs WHERE id <= ? AND {column} IS NOT NULL ORDER BY id DESC LIMIT 1", (run_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def record_run(self, payload, run_at=None, source=None):
+        """payload（data.json の内容）を新しい実行として追加し、(実行ID, 前回からの変化) を返す
+        store_key が同じ店舗が複数あるときは最初の1件だけを記録する"""
+        run_at = run_at or datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.connection:
+            previous_run = self.latest_run()
+            previous = self.state(previous_run) if previous_run is not None else {}
+            ids = {
+                (card_type, key, group_key): store_id
+                for store_id, card_type, key, group_key in self.connection.execute("SELECT id, card_type, key, group_key FROM stores")
+            }
+            current = {}
+            for item in payload.get("stores", []):
+                if not isinstance(item, dict) or not item.get("name"):
+                    continue
+                key = store_key(item)
+                store_id = ids.get(key)
+                if store_id is None:
+                    store_id = self.connection.execute(
+                        "INSERT INTO stores (card_type, key, group_key, name) VALUES (?, ?, ?, ?)", (*key, item["name"])
+                    ).lastrowid
+                    ids[key] = store_id
+                current.setdefault(store_id, item)
+
+            meta = canonical(payload.get("meta", {}))
+            layout = canonical(list(current))
+            run_id = self.connection.execute(
+                "INSERT INTO runs (run_at, source, meta, layout) VALUES (?, ?, ?, ?)",
+                (
+                    run_at,
+                    source,
+                    None if previous_run is not None and meta == self._latest_column("meta", previous_run) else meta,
+                    None if previous_run is not None and layout == self._latest_column("layout", previous_run) else layout,
+                ),
+            ).lastrowid
+
+            rows = []
+            for store_id, item in current.items():
+                if store_id not in previous or previous[store_id][2] != item:
+                    rows.append((store_id, run_id, canonical(item)))
+                    self.connection.execute("UPDATE stores SET name = ? WHERE id = ?", (item["name"], store_id))
+            rows.extend((store_id, run_id, None) for store_id in previous if store_id not in current)
+            self.connection.executemany("INSERT INTO versions (store_id, run_id, record) VALUES (?, ?, ?)", rows)
+        return run_id, self.diff(previous_run, run_id)
+
+    def snapshot(self, run_id=None):
+        """run_id（省略時は最新）の時点の data.json の内容"""
+        run_id = self.latest_run() if run_id is None else run_id
+        if run_id is None:
+            return {"meta": {}, "stores": [], "stores_hash": stores_hash([])}
+        state = self.state(run_id)
+        layout = json.loads(self._latest_column("layout", run_id) or "[]")
+        stores = [state[store_id][2] for store_id in layout if store_id in state]
+        return {"meta": json.loads(self._latest_column("meta", run_id) or "{}"), "stores": stores, "stores_hash": stores_hash(stores)}
+
+    def diff(self, run_a, run_b):
+        """run_a から run_b までの変化。カードごとの added / removed / changed（店舗名のリスト）"""
+        before = self.state(run_a) if run_a is not None else {}
+        after = self.state(run_b)
+        summary = {}
+        for store_id in set(before) | set(after):
+            card_type, name, record = after.get(store_id) or before[store_id]
+            if store_id not in before:
+                label = "added"
+            elif store_id not in after:
+                label = "removed"
+            elif before[store_id][2] != record:
+                label = "changed"
+            else:
+                continue
+            summary.setdefault(card_type, {"added": [], "removed": [], "changed": []})[label].append(name)
+        for change in summary.values():
+            for names in change.values():
+                names.sort()
+        return summary
+
+    def timeline(self, name, card_type=None):
+        """店舗の変化を古い順に返す。event は added / changed / removed、changed には変わった項目名を付ける"""
+        query = (
+            "SELECT stores.id, stores.card_type, runs.id, runs.run_at, versions.record FROM versions "
+            "JOIN stores ON stores.id = versions.store_id JOIN runs ON runs.id = versions.run_id "
+            "WHERE stores.key = ?"
+        )
+        params = [normalize_search_text(name)]
+        if card_type:
+            query += " AND stores.card_type = ?"
+            params.append(card_type)
+        events = []
+        last = {}
+        for store_id, card, run_id, run_at, record in self.connection.execute(
+            query + " ORDER BY stores.card_type, stores.group_key, runs.id", params
+        ):
+            record = json.loads(record) if record is not None else None
+            event = {"card_type": card, "run": run_id, "run_at": run_at}
+            if record is None:
+                event["event"] = "removed"
+            elif last.get(store_id) is None:
+                event.update(event="added", store=record)
+            else:
+                event.update(event="changed", fields=changed_fields(last[store_id], record), store=record)
+            last[store_id] = record
+            events.append(event)
+        return events
+
+
+def git_data_versions(path="data.json"):
+    """git の履歴にある data.json を古い順に (コミット, 日時, 内容) で返す"""
+    log = subprocess.run(
+        ["git", "log", "--reverse", "--format=%H %cI", "--", path],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    for line in log.splitlines():
+        commit, committed_at = line.split(" ", 1)
+        shown = subprocess.run(["git", "show", f"{commit}:{path}"], cwd=ROOT_DIR, capture_output=True, check=True)
+        try:
+            yield commit, committed_at, json.loads(shown.stdout.decode("utf-8"))
+        except ValueError as e:
+            print(f"WARNING: Skipping {path} at {commit[:12]}: {e}", flush=True)
+
+
+def import_git(history, path="data.json"):
+    imported = 0
+    for commit, committed_at, payload in git_data_versions(path):
+        if history.has_source(commit):
+            continue
+        history.record_run(payload, run_at=committed_at, source=commit)
+        imported += 1
+    return imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the store history database")
+    parser.add_argument("--db", type=Path, default=HISTORY_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("runs", help="list recorded runs")
+    timeline = commands.add_parser("timeline", help="show when a store was added, changed or removed")
+    timeline.add_argument("name")
+    timeline.add_argument("--card")
+    diff = commands.add_parser("diff", help="compare two runs")
+    diff.add_argument("run_a", type=int)
+    diff.add_argument("run_b", type=int)
+    export = commands.add_parser("export", help="print the data.json of a run (default: latest)")
+    export.add_argument("--run", type=int)
+    imported = commands.add_parser("import-git", help="record every committed data.json not yet in the database")
+    imported.add_argument("--file", default="data.json")
+    args = parser.parse_args(argv)
+
+    with HistoryStore(args.db) as history:
+        if args.command == "runs":
+            result = history.runs()
+        elif args.command == "timeline":
+            result = history.timeline(args.name, args.card)
+        elif args.command == "diff":
+            result = history.diff(args.run_a, args.run_b)
+        elif args.command == "export":
+            result = history.snapshot(args.run)
+        else:
+            count = import_git(history, args.file)
+            print(f"SUCCESS: Imported {count} data.json versions into {args.db}", file=sys.stderr, flush=True)
+            return 0
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import re
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+from sources import source_field
+
+# カードごとの本文セクション（sources.SOURCES の selector）。見つかればその部分のテキストだけを Gemini に渡す
+# （見つからなければ cleaners.clean_extract_text が trafilatura で抽出する）
+SECTION_SELECTORS = source_field("selector")
+
+# BeautifulSoup の get_text と同じく、これらの中身はテキストに含めない
+SKIP_TEXT_TAGS = {"script", "style", "template"}
+SIMPLE_SELECTOR_RE = re.compile(r"^([a-zA-Z][\w-]*)?((?:[#.][\w-]+)*)$")
+SELECTOR_PART_RE = re.compile(r"([#.])([\w-]+)")
+
+
+def selector_xpath(selector):
+    """「tag#id.class」を空白でつないだだけの単純なセレクターを XPath にする。それ以外は None"""
+    steps = []
+    for part in selector.split():
+        match = SIMPLE_SELECTOR_RE.match(part)
+        if not match or not part:
+            return None
+        conditions = []
+        for kind, name in SELECTOR_PART_RE.findall(match.group(2)):
+            if kind == "#":
+                conditions.append(f"@id='{name}'")
+            else:
+                conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')")
+        step = "//" + (match.group(1) or "*").lower()
+        steps.append(step + "".join(f"[{condition}]" for condition in conditions))
+    return "(" + "".join(steps) + ")[1]" if steps else None
+
+
+def _strings(element):
+    if isinstance(element.tag, str) and element.tag not in SKIP_TEXT_TAGS:
+        if element.text:
+            yield element.text
+        for child in element:
+            # コメントや処理命令は tag が文字列ではないので中身は飛ばし、後ろのテキストだけ拾う
+            yield from _strings(child)
+            if child.tail:
+                yield child.tail
+
+
+def _join_strings(strings):
+    return " ".join(text for text in (string.strip() for string in strings) if text)
+
+
+def select_text_lxml(html_text, selector):
+    xpath = selector_xpath(selector)
+    if lxml is None or xpath is None:
+        raise ValueError(f"lxml backend cannot handle selector {selector!r}")
+    matches = lxml.html.fromstring(html_text).xpath(xpath)
+    return _join_strings(_strings(matches[0])) if matches else None
+
+
+def select_text_bs4(html_text, selector):
+    from bs4 import BeautifulSoup
+    target = BeautifulSoup(html_text, "html.parser").select_one(selector)
+    return target.get_text(separator=" ", strip=True) if target else None
+
+
+def select_text(html_text, selector):
+    """selector に最初に一致した要素のテキスト（get_text(separator=' ', strip=True) と同じ形）。
+    lxml で扱えなければ BeautifulSoup で探す。見つからなければ None"""
+    try:
+        return select_text_lxml(html_text, selector)
+    except Exception as e:
+        print(f"DEBUG: lxml selection failed for {selector} ({e}); using BeautifulSoup", flush=True)
+    return select_text_bs4(html_text, selector)
@@ -0,0 +1,86 @@
+import json
+import re
+
+# Gemini のストリーミング応答（JSON 配列）を届いた分から1要素ずつ取り出す
+# 文字列の中の括弧は数えず、配列直下の要素が閉じた時点で json.loads する
+OUTSIDE_STRING_RE = re.compile(r'[\[\]{}"]')
+INSIDE_STRING_RE = re.compile(r'["\\]')
+
+
+class JsonArrayStream:
+    """feed(text) のたびに、新しく閉じた配列要素のリストを返す。壊れた要素は errors に残して読み飛ばす"""
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.errors = []
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        # 読み途中の要素の開始位置（_buffer 内）
+        self._start = None
+
+    def feed(self, text):
+        items = []
+        buffer = self._buffer + text
+        pos = self._pos
+        while not self.finished:
+            if self._in_string:
+                match = INSIDE_STRING_RE.search(buffer, pos)
+                if not match:
+                    pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.end() >= len(buffer):
+                        # エスケープ対象の文字がまだ届いていない
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = OUTSIDE_STRING_RE.search(buffer, pos)
+            if not match:
+                pos = len(buffer)
+                break
+            char = match.group()
+            pos = match.end()
+            if not self.started:
+                # 先頭の ```json などは読み飛ばす
+                if char == "[":
+                    self.started = True
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 1:
+                    self._start = match.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1 and self._start is not None:
+                    self._take(buffer[self._start:pos], items)
+                    self._start = None
+                elif self._depth <= 0:
+                    self.finished = True
+
+        # 取り出し済みの部分は捨てて、読み途中の要素だけ残す
+        keep = self._start if self._start is not None else pos
+        self._buffer = buffer[keep:]
+        self._pos = pos - keep
+        if self._start is not None:
+            self._start = 0
+        return items
+
+    def _take(self, raw, items):
+        try:
+            items.append(json.loads(raw))
+        except ValueError as e:
+            self.errors.append(f"{e}: {raw[:200]}")
+
+    @property
+    def complete(self):
+        return self.started and self.finished and not self.errors
@@ -1,49 +1,63 @@
 import os
 
-from scrape_common import build_session, decode_response, headers_for, is_useful_content
+from cache_store import CacheStore
+from cleaners import CACHE_CLEANER_VERSION, clean_cache_html, clean_extract_text, extract_cleaner_id
+from scrape_common import (
+    build_session,
+    conditional_headers,
+    content_hash,
+    declared_encoding,
+    decode_response,
+    headers_for,
+    is_useful_content,
+    read_fetched_body,
+)
+from sources import source_field
 
 # --- Configuration ---
 # このスクリプトは自宅サーバー(IP制限のない環境)で実行され、
 # HTMLを取得してリポジトリにコミット＆プッシュする。
 
-URLS = {
-    "SMBC": "https://www.smbc-card.com/mem/wp/vpoint_up_program/index.jsp",
-    "MUFG": "https://www.cr.mufg.jp/mufgcard/point/global/save/convenience_store/index.html"
-}
+URLS = source_field("url")
 
 CACHE_DIR = os.path.join(os.path.dirname(__file__), "html_cache")
+# 保存した HTML・Gemini 用テキストと、取得時の ETag / Last-Modified / ハッシュ（html_cache/index.json）
+STORE = CacheStore(CACHE_DIR)
 SESSION = build_session()
 
-def clean_html_aggressive(html_text):
-    import re
-    if not html_text: return ""
-    # 巨大ブロック削除
-    blocks_to_kill = r'<(header|footer|nav|noscript|script|style|iframe|svg|aside)[^>]*>.*?</\1>'
-    html_text = re.sub(blocks_to_kill, '', html_text, flags=re.DOTALL | re.IGNORECASE)
-    html_text = re.sub(r'<!--.*?-->', '', html_text, flags=re.DOTALL)
-    # リンク以外削除
-    html_text = re.sub(r'<((?!a\s)[a-z0-9]+)\s+[^>]*>', r'<\1>', html_text, flags=re.IGNORECASE)
-    
-    attrs_to_remove = ['class', 'id', 'style', 'target', 'rel', 'onclick', 'data-[a-z0-9-]+', 'aria-[a-z-]+', 'role']
-    for attr in attrs_to_remove:
-        html_text = re.sub(r'\s+' + attr + r'="[^"]*"', '', html_text, flags=re.IGNORECASE)
-        html_text = re.sub(r'\s+' + attr + r"='[^']*'", '', html_text, flags=re.IGNORECASE)
+clean_html_aggressive = clean_cache_html
 
-    tags_to_strip = ['div', 'span', 'section', 'article', 'main', 'body', 'html', 'head']
-    for tag in tags_to_strip:
-        html_text = re.sub(r'<' + tag + r'[^>]*>', '', html_text, flags=re.IGNORECASE)
-        html_text = re.sub(r'</' + tag + r'>', '\n', html_text, flags=re.IGNORECASE)
-
-    html_text = re.sub(r'\n+', '\n', html_text)
-    html_text = re.sub(r' +', ' ', html_text)
-    html_text = "\n".join(line.rstrip() for line in html_text.splitlines())
-    return html_text[:95000].strip() + "\n"
+def extract_artifact(name, raw_html):
+    # scraper が直接取得したときと同じ Gemini 用テキストを、属性を落とす前の HTML から作っておく
+    try:
+        text = clean_extract_text(raw_html, name)
+    except Exception as e:
+        print(f"Skipping extract text for {name}: {e}")
+        return None
+    return {"text": text, "cleaner": extract_cleaner_id(name), "valid": is_useful_content(name, text)}
 
 def fetch_and_save(name, url):
     print(f"Fetching {name} from {url}...")
+    filepath = STORE.html_path(name)
     try:
-        resp = SESSION.get(url, headers=headers_for(name), timeout=30)
+        headers = headers_for(name)
+        entry = STORE.entry(name)
+        # 保存済みのキャッシュが今のクリーナーで作られている場合だけ、条件付きリクエストにする
+        current = STORE.is_current(name, CACHE_CLEANER_VERSION, extract_cleaner_id(name))
+        if current:
+            headers.update(conditional_headers(entry))
+        resp = SESSION.get(url, headers=headers, timeout=30, stream=True)
+        # 2xx だけ上限つきで読み、ブロックページなどはデコード・クリーニングの前に落とす
+        # （304・エラーは本文を読まずに接続を閉じる）
+        read_fetched_body(resp)
+        if current and resp.status_code == 304:
+            print(f"{name} not modified (304); keeping {filepath}")
+            return True
         resp.raise_for_status()
+        source_hash = content_hash(resp.content)
+        if current and entry.get("source_hash") == source_hash:
+            print(f"{name} body unchanged; keeping {filepath}")
+            return True
         raw_html = decode_response(resp)
         
         # HTMLを軽量化してから保存
@@ -52,9 +66,17 @@ def fetch_and_save(name, url):
             raise ValueError("Fetched HTML does not include expected official content")
         
         # 保存
-        filepath = os.path.join(CACHE_DIR, f"{name}.html")
-        with open(filepath, "w", encoding="utf-8", newline="\n") as f:
-            f.write(content)
+        STORE.save(
+            name,
+            content,
+            extract=extract_artifact(name, raw_html),
+            url=url,
+            encoding=declared_encoding(resp.content, resp.headers),
+            source_hash=source_hash,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            cleaner=CACHE_CLEANER_VERSION,
+        )
         print(f"Saved {name} to {filepath} ({len(content)} chars)")
         return True
     except Exception as e:
@@ -0,0 +1,74 @@
+import argparse
+import contextlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import scraper
+from cleaners import clean_cache_html
+
+# CI の事前チェック。全カードのソースを「直接取得」と「html_cache のみ」の両方で並列に確認し、
+# 結果を JSON で標準出力に書く（ログは標準エラー）。google-genai・trafilatura は読み込まない
+#   python preflight.py --json logs/preflight.json
+MODES = ("live", "cache")
+
+
+def validation_cleaner(html_text, card_name=""):
+    # local_updater がキャッシュを保存するときと同じ軽量化で公式ページかどうかを確かめる
+    # （抽出用の trafilatura は重いので、ここでは使わない）
+    return clean_cache_html(html_text)
+
+
+def check_card(card_name, url, mode):
+    started = time.perf_counter()
+    result = {"card": card_name, "mode": mode, "ok": False}
+    try:
+        document, source = scraper.get_source_html(
+            card_name, url, cache_only=(mode == "cache"), cleaner=validation_cleaner
+        )
+        result["source"] = source
+        if document:
+            result["ok"] = bool(document.useful)
+            result["chars"] = len(document.cleaned)
+            result["source_hash"] = document.source_hash
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def run_preflight(modes=MODES):
+    started = time.perf_counter()
+    checks = [(card, url, mode) for mode in modes for card, url in scraper.URLS.items()]
+    with ThreadPoolExecutor(max_workers=max(1, len(checks))) as executor:
+        results = list(executor.map(lambda check: check_card(*check), checks))
+    return {
+        "ok": all(result["ok"] for result in results),
+        "seconds": round(time.perf_counter() - started, 4),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every card source, live and from html_cache, in one pass")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_preflight(args.modes)
+        for result in report["results"]:
+            status = "OK" if result["ok"] else "CHECK FAILED"
+            print(f"{status}: {result['card']} {result['mode']} source={result.get('source')} chars={result.get('chars', 0)}", flush=True)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(text + "\n", encoding="utf-8")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+from search_index import build_search_index, stores_hash
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# data.min.json の形式
+#   stores_hash:      search_index.stores_hash（data.json と同じ値）
+#   strings:          2回以上出てくる文字列のテーブル
+#   fields:           stores の各配列の並び（COMPACT_FIELDS のあとに、それ以外のキーが出てきた順に続く）
+#   condition_fields: conditions の配列の並び（同上）
+# 値の書き方: 整数は strings の添字、{} はキーがないこと、{"v": 値} は数値・オブジェクトをそのまま入れたもの。
+# それ以外（文字列・null・真偽値・配列）はそのままの値。末尾のキーがないものは配列ごと省く
+COMPACT_VERSION = 2
+COMPACT_FIELDS = ("name", "group", "aliases", "conditions", "official_list_url", "card_type", "source_url")
+CONDITION_FIELDS = ("payment_method", "mobile_order", "delivery", "note")
+# 1 でカード別の data/<card>.min.json も書き出す
+PUBLISH_SHARDS = os.environ.get("PUBLISH_SHARDS") == "1"
+
+
+def _field_order(known, mappings):
+    fields = list(known)
+    for mapping in mappings:
+        fields.extend(key for key in mapping if key not in fields)
+    return fields
+
+
+def _strings(stores):
+    for store in stores:
+        for field, value in store.items():
+            if field == "conditions" and isinstance(value, dict):
+                yield from (item for item in value.values() if isinstance(item, str))
+            elif isinstance(value, str):
+                yield value
+
+
+def _encode(value, positions):
+    if isinstance(value, str):
+        return positions.get(value, value)
+    if isinstance(value, (dict, int, float)) and not isinstance(value, bool):
+        return {"v": value}
+    return value
+
+
+def _decode(item, strings):
+    if type(item) is int:
+        return strings[item]
+    if isinstance(item, dict):
+        return item["v"]
+    return item
+
+
+def _encode_row(fields, mapping, encode):
+    row = [encode(field, mapping[field]) if field in mapping else {} for field in fields]
+    while row and row[-1] == {}:
+        row.pop()
+    return row
+
+
+def _decode_row(fields, row, decode):
+    return {field: decode(field, item) for field, item in zip(fields, row) if item != {}}
+
+
+def compact_payload(output):
+    stores = output.get("stores", [])
+    counts = Counter(_strings(stores))
+    strings = sorted(value for value, count in counts.items() if count > 1)
+    positions = {value: index for index, value in enumerate(strings)}
+    fields = _field_order(COMPACT_FIELDS, stores)
+    condition_fields = _field_order(
+        CONDITION_FIELDS, (store["conditions"] for store in stores if isinstance(store.get("conditions"), dict))
+    )
+
+    def encode(field, value):
+        if field != "conditions":
+            return _encode(value, positions)
+        if isinstance(value, dict):
+            return _encode_row(condition_fields, value, lambda _, item: _encode(item, positions))
+        # 配列は conditions の配列と区別できないので包む
+        return {"v": value} if isinstance(value, list) else _encode(value, positions)
+
+    payload = {
+        "version": COMPACT_VERSION,
+        "meta": output.get("meta", {}),
+        "fields": fields,
+        "condition_fields": condition_fields,
+        "strings": strings,
+        "stores": [_encode_row(fields, store, encode) for store in stores],
+    }
+    if "stores_hash" in output:
+        payload["stores_hash"] = output["stores_hash"]
+    return payload
+
+
+def expand_payload(payload):
+    strings = payload["strings"]
+    condition_fields = payload["condition_fields"]
+
+    def decode(field, item):
+        if field == "conditions" and isinstance(item, list):
+            return _decode_row(condition_fields, item, lambda _, value: _decode(value, strings))
+        return _decode(item, strings)
+
+    output = {"meta": payload["meta"], "stores": [_decode_row(payload["fields"], row, decode) for row in payload["stores"]]}
+    if "stores_hash" in payload:
+        output["stores_hash"] = payload["stores_hash"]
+    return output
+
+
+def _write_bytes(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    written = [path]
+    # 事前圧縮版（gzip_static などで配信する場合用）。mtime=0 で毎回同じバイト列にする
+    gz_path = path.with_name(path.name + ".gz")
+    with open(gz_path, "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(gz_path)
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        with open(br_path, "wb") as f:
+            f.write(brotli.compress(data))
+        written.append(br_path)
+    return written
+
+
+def _dump_compact(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def publish(output, data_file, search_index_file, shards=PUBLISH_SHARDS):
+    """data.json（互換用）を書き、続けて軽量版・圧縮版・検索インデックスを書き出す
+    どのファイルにも同じ stores_hash を入れ、index.html が組み合わせを確かめられるようにする"""
+    data_file = Path(data_file)
+    output = {**output, "stores_hash": stores_hash(output.get("stores", []))}
+    with data_file.open("w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    written = [data_file]
+
+    # data.json 以外は失敗しても致命的ではない（index.html は data.json にフォールバックする）
+    compact_file = data_file.with_name("data.min.json")
+    try:
+        compact = _dump_compact(compact_payload(output))
+        # 展開して data.json と同じにならなければ書かない
+        if expand_payload(json.loads(compact)) != json.loads(json.dumps(output)):
+            raise ValueError("data.min.json does not round-trip to data.json")
+        written += _write_bytes(compact_file, compact)
+        if shards:
+            by_card = {}
+            for store in output.get("stores", []):
+                by_card.setdefault(store.get("card_type") or "unknown", []).append(store)
+            for card, stores in by_card.items():
+                payload = compact_payload({"meta": output.get("meta", {}), "stores": stores})
+                written += _write_bytes(data_file.parent / "data" / f"{card}.min.json", _dump_compact(payload))
+    except Exception as e:
+        print(f"WARNING: Could not write compact data files: {e}", flush=True)
+        # 古い data.min.json が残っていると index.html がそちらを読んでしまう
+        for path in (compact_file, compact_file.with_name(compact_file.name + ".gz"), compact_file.with_name(compact_file.name + ".br")):
+            path.unlink(missing_ok=True)
+
+    try:
+        written += _write_bytes(Path(search_index_file), _dump_compact(build_search_index(output.get("stores", []))))
+    except Exception as e:
+        # 検索インデックスがなくても index.html はその場で作り直せる
+        print(f"WARNING: Could not write {Path(search_index_file).name}: {e}", flush=True)
+
+    return written
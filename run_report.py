@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+# スクレイパー1回分の処理時間・サイズを記録し、logs/ に JSONL で書き出す
+# 1行目が run の概要、以降は span（fetch / decode / clean / gemini_call ...）1件ずつ
+
+# stage ごとの集計で合計する件数フィールド
+SUMMED_FIELDS = ("bytes", "input_chars", "chars", "prompt_chars", "prompt_tokens", "output_tokens", "items")
+
+_lock = threading.Lock()
+_spans = []
+_counters = {}
+_run_started = time.perf_counter()
+_run_started_at = datetime.now(timezone.utc)
+
+
+def reset():
+    global _run_started, _run_started_at
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _run_started = time.perf_counter()
+        _run_started_at = datetime.now(timezone.utc)
+
+
+@contextmanager
+def span(stage, card=None, **fields):
+    """with span("clean", card) as record: record["chars"] = ... のように件数も一緒に記録する"""
+    record = {"stage": stage, "card": card, **fields}
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["start"] = round(started - _run_started, 4)
+        record["duration"] = round(time.perf_counter() - started, 4)
+        record["thread"] = threading.current_thread().name
+        with _lock:
+            _spans.append(record)
+
+
+def count(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def stage_summary():
+    with _lock:
+        spans = list(_spans)
+    stages = {}
+    for record in spans:
+        stage = stages.setdefault(record["stage"], {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stage["count"] += 1
+        stage["total_seconds"] = round(stage["total_seconds"] + record["duration"], 4)
+        stage["max_seconds"] = max(stage["max_seconds"], record["duration"])
+        for key in SUMMED_FIELDS:
+            if isinstance(record.get(key), (int, float)):
+                stage[key] = stage.get(key, 0) + record[key]
+    return stages
+
+
+def write_report(log_dir, extra=None):
+    log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    path = log_dir / f"run_{_run_started_at.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    with _lock:
+        spans = sorted(_spans, key=lambda record: record["start"])
+        counters = dict(_counters)
+    header = {
+        "type": "run",
+        "started_at": _run_started_at.isoformat(timespec="seconds"),
+        "duration": round(time.perf_counter() - _run_started, 4),
+        "counters": counters,
+        "stages": stage_summary(),
+        **(extra or {}),
+    }
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for record in spans:
+            f.write(json.dumps({"type": "span", **record}, ensure_ascii=False) + "\n")
+    return path
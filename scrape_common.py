@@ -1,10 +1,20 @@
+import codecs
+import functools
+import hashlib
 import re
+import threading
+import time
+import unicodedata
 from collections import OrderedDict
+from urllib.parse import urlparse
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from run_report import span
+from sources import source_field
+
 
 DEFAULT_HEADERS = {
     "User-Agent": (
@@ -28,20 +38,10 @@ DEFAULT_HEADERS = {
     "Upgrade-Insecure-Requests": "1",
 }
 
-CARD_HEADERS = {
-    "MUFG": {
-        "Referer": "https://www.cr.mufg.jp/",
-        "Sec-Fetch-Site": "same-origin",
-    },
-    "SMBC": {
-        "Referer": "https://www.smbc-card.com/",
-    },
-}
-
-CONTENT_MARKERS = {
-    "SMBC": ("Vポイント", "対象店舗", "マクドナルド"),
-    "MUFG": ("三菱UFJ", "対象店舗", "セブン"),
-}
+CARD_HEADERS = source_field("headers")
+CONTENT_MARKERS = source_field("markers")
+# 全カードの CONTENT_MARKERS（TextStats.markers で有無を調べる）
+SCAN_MARKERS = frozenset(marker for markers in CONTENT_MARKERS.values() for marker in markers)
 
 MOJIBAKE_MARKERS = (
     "\u00e3",
@@ -52,6 +52,34 @@ MOJIBAKE_MARKERS = (
     "\u00c2",
 )
 JP_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+JP_RUN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]+")
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+META_SCAN_BYTES = 4096
+DECODE_SAMPLE_BYTES = 65536
+# サンプル採点で同点でも曖昧とみなさない上位互換のエンコーディング
+ENCODING_FAMILIES = {"shift_jis": "cp932"}
+
+# stream=True で取得した本文の読み込み（read_body）
+# 上限を超える本文は公式ページではないとみなし、読み切る前にやめる
+MAX_BODY_BYTES = 5 * 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+# ブロックページ・ボット対策ページの目印。本物のページにも reCAPTCHA などは出てくるので、
+# 拒否ページのタイトル・文言に限り、先頭 BLOCK_SCAN_BYTES バイトだけを見る
+BLOCK_PAGE_RE = re.compile(
+    rb"<title>\s*(?:Access Denied|Attention Required!|Just a moment\.\.\.|Request Rejected|403 Forbidden|Pardon Our Interruption)"
+    rb"|The requested URL was rejected|/_Incapsula_Resource|cf-browser-verification",
+    re.IGNORECASE,
+)
+BLOCK_SCAN_BYTES = 16384
+HTML_CONTENT_TYPES = ("text/", "application/xhtml", "application/xml")
+MIN_CONTENT_CHARS = 500
+
+# 同一ホストへの連続アクセスの最小間隔（秒）
+HOST_MIN_INTERVAL = 2.0
+
+_host_locks = {}
+_host_last_request = {}
+_host_locks_guard = threading.Lock()
 
 
 def headers_for(card_name):
@@ -78,25 +106,159 @@ def build_session():
     return session
 
 
+def polite_get(session, url, headers=None, timeout=60, min_interval=HOST_MIN_INTERVAL, **kwargs):
+    # ホストごとに1リクエストずつ、min_interval 秒以上あけて送る（スレッドセーフ）
+    # kwargs は session.get にそのまま渡す（stream=True など）
+    host = urlparse(url).netloc
+    with _host_locks_guard:
+        lock = _host_locks.setdefault(host, threading.Lock())
+    with lock:
+        wait = _host_last_request.get(host, float("-inf")) + min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            return session.get(url, headers=headers, timeout=timeout, **kwargs)
+        finally:
+            _host_last_request[host] = time.monotonic()
+
+
+class FetchAborted(Exception):
+    """本文を読み切る前、またはデコード・クリーニングの前に、使えないページだと分かった"""
+
+
+def _check_body_headers(response, max_bytes):
+    headers = response.headers or {}
+    length = headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise FetchAborted(f"body too large (Content-Length {length} > {max_bytes})")
+    content_type = (headers.get("content-type") or "").lower()
+    if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+        raise FetchAborted(f"unexpected content type {content_type}")
+
+
+def read_body(response, max_bytes=MAX_BODY_BYTES, chunk_size=STREAM_CHUNK_BYTES):
+    """stream=True で受け取ったレスポンスの本文を max_bytes まで読み、response.content として使えるようにして返す
+    次の場合は FetchAborted を送出する（読んでいる途中ならそこでやめる）
+      - 本文が max_bytes を超える / HTML 以外の Content-Type
+      - 先頭にブロックページ・ボット対策ページの目印がある
+    公式ページかどうか（is_useful_content）はクリーニング後に判定する。クリーナーは隣り合うインライン要素の
+    テキストをつなげる（<span>三菱</span><span>UFJ</span> → 三菱UFJ）ので、生の HTML では判定できない"""
+    chunks = []
+    size = 0
+    try:
+        _check_body_headers(response, max_bytes)
+        for chunk in response.iter_content(chunk_size):
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            if size < BLOCK_SCAN_BYTES <= size + len(chunk):
+                _check_block_page(b"".join(chunks))
+            size += len(chunk)
+            if size > max_bytes:
+                raise FetchAborted(f"body exceeded {max_bytes} bytes")
+    finally:
+        response.close()
+
+    body = b"".join(chunks)
+    if size < BLOCK_SCAN_BYTES:
+        _check_block_page(body)
+    response._content = body
+    response._content_consumed = True
+    return body
+
+
+def read_fetched_body(resp):
+    # 2xx の本文だけを上限つきで読む（304・エラーの本文は読まずに接続を閉じる）
+    if 200 <= resp.status_code < 300:
+        return len(read_body(resp))
+    resp.close()
+    return 0
+
+
+def _check_block_page(head):
+    if BLOCK_PAGE_RE.search(head, 0, BLOCK_SCAN_BYTES):
+        raise FetchAborted("block page detected")
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+class lazy_property:
+    # functools.cached_property は Python 3.11 以前だとクラス単位のロックを取り、
+    # 別スレッドの別ドキュメントのクリーニングまで直列化されてしまうため使わない
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.func(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class TextStats:
+    """1つの文字列の検証用の集計。日本語文字数・文字化けマーカー数・CONTENT_MARKERS の有無を、
+    初めて使うときに1回だけ数える（looks_mojibake は文字化けマーカーが少なければ日本語文字を数えない）"""
+
+    def __init__(self, text):
+        self.text = text
+
+    @lazy_property
+    def japanese(self):
+        # findall で1文字ずつリストにするより、日本語の並びを消した長さとの差のほうが速い
+        return len(self.text) - len(JP_RUN_RE.sub("", self.text))
+
+    @lazy_property
+    def mojibake(self):
+        return sum(self.text.count(marker) for marker in MOJIBAKE_MARKERS)
+
+    @lazy_property
+    def markers(self):
+        return frozenset(marker for marker in SCAN_MARKERS if marker in self.text)
+
+
+# デコード候補の採点・文字化け判定・検証で同じ文字列が何度も渡されるので、直近の集計を使い回す
+@functools.lru_cache(maxsize=32)
+def _text_stats(text):
+    return TextStats(text)
+
+
+def text_stats(text):
+    return _text_stats(text or "")
+
+
 def japanese_char_count(text):
-    return len(JP_RE.findall(text or ""))
+    return text_stats(text).japanese
 
 
 def mojibake_marker_count(text):
-    if not text:
-        return 0
-    return sum(text.count(marker) for marker in MOJIBAKE_MARKERS)
+    return text_stats(text).mojibake
 
 
 def text_score(text):
-    return japanese_char_count(text) - mojibake_marker_count(text) * 8
+    stats = text_stats(text)
+    return stats.japanese - stats.mojibake * 8
 
 
 def looks_mojibake(text):
     if not text:
         return False
-    marker_count = mojibake_marker_count(text)
-    return marker_count >= 5 and marker_count > japanese_char_count(text) // 4
+    stats = text_stats(text)
+    return stats.mojibake >= 5 and stats.mojibake > stats.japanese // 4
 
 
 def repair_mojibake(text):
@@ -117,8 +279,26 @@ def _unique(items):
     return [item for item in OrderedDict.fromkeys(item for item in items if item)]
 
 
-def decode_bytes(raw, headers=None):
-    headers = headers or {}
+def declared_encoding(raw, headers=None):
+    header_encoding = requests.utils.get_encoding_from_headers(headers or {})
+    # requests は charset 未指定の text/* を ISO-8859-1 とみなすので宣言として扱わない
+    if header_encoding and header_encoding.lower() not in ("iso-8859-1", "latin-1"):
+        return header_encoding
+    match = META_CHARSET_RE.search(raw[:META_SCAN_BYTES])
+    if match:
+        return match.group(1).decode("ascii")
+    return None
+
+
+def _strict_decode(raw, encoding):
+    try:
+        return raw.decode(encoding)
+    except (LookupError, UnicodeError):
+        return None
+
+
+def _decode_bytes_full(raw, headers):
+    # 文字コード判定を本文全体にかけ、全候補を全文デコードして比較する（従来の方式）
     header_encoding = requests.utils.get_encoding_from_headers(headers)
     apparent = None
     if raw:
@@ -151,11 +331,52 @@ def decode_bytes(raw, headers=None):
     return repair_mojibake(best)
 
 
+def decode_bytes(raw, headers=None):
+    headers = headers or {}
+    if not raw:
+        return ""
+
+    # 1. strict UTF-8（他の日本語エンコーディングで偶然通ることはほぼない）→ 宣言された charset
+    declared = declared_encoding(raw, headers)
+    for encoding in _unique(["utf-8", declared]):
+        text = _strict_decode(raw, encoding)
+        if text is None:
+            continue
+        if looks_mojibake(text):
+            text = repair_mojibake(text)
+            if looks_mojibake(text):
+                continue
+        if encoding == "utf-8" or JP_RE.search(text, 0, DECODE_SAMPLE_BYTES):
+            return text
+
+    # 2. 日本語の候補を先頭サンプルだけで採点し、明確な勝者がいれば全文をデコードする
+    sample = raw[:DECODE_SAMPLE_BYTES]
+    scored = []
+    for encoding in _unique([declared, "cp932", "shift_jis", "euc_jp"]):
+        try:
+            decoded = sample.decode(encoding, errors="ignore")
+            family = ENCODING_FAMILIES.get(codecs.lookup(encoding).name, codecs.lookup(encoding).name)
+        except LookupError:
+            continue
+        scored.append((text_score(decoded), family, encoding))
+    ranked = sorted(scored, key=lambda item: item[0], reverse=True)
+    if ranked and ranked[0][0] > 0:
+        best_score, best_family, best_encoding = ranked[0]
+        # cp932 と shift_jis の同点は同じ系統なので曖昧とはみなさない
+        ambiguous = any(score == best_score and family != best_family for score, family, _ in ranked[1:])
+        text = None if ambiguous else _strict_decode(raw, best_encoding)
+        if text is not None:
+            return repair_mojibake(text)
+
+    # 3. 判定がつかない場合のみ全文で文字コード判定する
+    return _decode_bytes_full(raw, headers)
+
+
 def decode_response(response):
     return decode_bytes(response.content, response.headers)
 
 
-def is_useful_content(card_name, text, min_chars=500):
+def is_useful_content(card_name, text, min_chars=MIN_CONTENT_CHARS):
     if not text or len(text) < min_chars:
         return False
 
@@ -163,5 +384,80 @@ def is_useful_content(card_name, text, min_chars=500):
     if looks_mojibake(repaired):
         return False
 
-    markers = CONTENT_MARKERS.get(card_name, ())
-    return all(marker in repaired for marker in markers)
+    found = text_stats(repaired).markers
+    return all(marker in found for marker in CONTENT_MARKERS.get(card_name, ()))
+
+
+class SourceDocument:
+    """取得したページ1件分。デコード・クリーニング・検証は初回アクセス時に一度だけ行う"""
+
+    def __init__(self, card_name, raw=None, headers=None, text=None, cleaner=None):
+        self.card_name = card_name
+        self.raw = raw
+        self.headers = headers or {}
+        self.cleaner = cleaner
+        if text is not None:
+            self.text = text
+
+    @classmethod
+    def from_response(cls, card_name, response, cleaner=None):
+        return cls(card_name, raw=response.content, headers=response.headers, cleaner=cleaner)
+
+    @lazy_property
+    def text(self):
+        with span("decode", self.card_name, bytes=len(self.raw or b"")) as record:
+            text = decode_bytes(self.raw or b"", self.headers)
+            record["chars"] = len(text)
+        return text
+
+    @lazy_property
+    def source_hash(self):
+        return content_hash(self.raw if self.raw is not None else self.text)
+
+    @lazy_property
+    def cleaned(self):
+        if self.cleaner is None:
+            return self.text
+        text = self.text
+        with span("clean", self.card_name, input_chars=len(text)) as record:
+            cleaned = self.cleaner(text, self.card_name)
+            record["chars"] = len(cleaned)
+        return cleaned
+
+    @lazy_property
+    def useful(self):
+        cleaned = self.cleaned
+        with span("validate", self.card_name) as record:
+            record["valid"] = is_useful_content(self.card_name, cleaned)
+        return record["valid"]
+
+
+class _SearchFold(dict):
+    # str.translate 用の変換表。文字ごとの結果を初めて出てきたときに計算して覚えておく
+    def __missing__(self, code):
+        char = chr(code)
+        if "\u30a1" <= char <= "\u30f6":
+            folded = code - 0x60
+        elif unicodedata.category(char)[0] in ("P", "S", "Z") or char.isspace() or char == "\ufeff":
+            folded = None
+        else:
+            folded = code
+        self[code] = folded
+        return folded
+
+
+_SEARCH_FOLD = _SearchFold()
+
+
+def normalize_search_text(text):
+    # index.html の normalizeSearchText と同じ正規化（NFKC・カタカナ→ひらがな・記号/空白除去）
+    if not text:
+        return ""
+    return unicodedata.normalize("NFKC", text).translate(_SEARCH_FOLD).lower()
+
+
+def store_key(item, card_type=None):
+    # 同じ店舗かどうかの判定 (カード, 正規化した店舗名, 正規化したグループ名)
+    # セクションの重複排除・前回との比較・履歴のどれもこのキーを使う
+    card = item.get("card_type") if card_type is None else card_type
+    return card or "", normalize_search_text(item.get("name")), normalize_search_text(item.get("group"))
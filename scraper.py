@@ -1,68 +1,119 @@
 import os
 import json
 import time
+import hashlib
 import re
 import sys
+import threading
+import cProfile
+import pstats
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 from urllib.parse import urljoin
-from google import genai
-from google.genai import types
-from google.genai.errors import ClientError
-import trafilatura
 
+from aliases import (
+    add_aliases,
+    apply_alias_dictionary,
+    load_alias_dictionary,
+    save_alias_dictionary,
+    seed_alias_dictionary,
+)
+from batching import RequestBatcher
+from cache_store import CacheStore
+from cleaners import clean_extract_text, extract_cleaner_id
+from gemini_client import GEMINI_CONCURRENCY, GeminiError, call_stats, generate, generate_stream
+from history import HistoryStore
+from json_stream import JsonArrayStream
+from publish import publish
+from run_report import count, span, write_report
 from scrape_common import (
+    SourceDocument,
     build_session,
-    decode_bytes,
-    decode_response,
+    conditional_headers,
+    content_hash,
     headers_for,
-    is_useful_content,
-    repair_mojibake,
+    polite_get,
+    read_fetched_body,
+    store_key,
 )
+from sources import SOURCES, source_field
 
 # --- Configuration ---
-API_KEY = os.environ.get("GEMINI_API_KEY")
 MODEL_ID = os.environ.get("GEMINI_MODEL_ID", "gemini-flash-latest")
 ROOT_DIR = Path(__file__).resolve().parent
 CACHE_DIR = ROOT_DIR / "html_cache"
 DATA_FILE = ROOT_DIR / "data.json"
-SESSION = build_session()
-_client = None
-
-URLS = {
-    "SMBC": "https://www.smbc-card.com/mem/wp/vpoint_up_program/index.jsp",
-    "MUFG": "https://www.cr.mufg.jp/mufgcard/point/global/save/convenience_store/index.html"
-}
-
-OFFICIAL_LINKS = {
-    "SMBC": "https://www.smbc-card.com/mem/wp/vpoint_up_program/index.jsp",
-    "MUFG": "https://www.cr.mufg.jp/mufgcard/point/global/save/convenience_store/index.html"
-}
-
-BASE_DOMAINS = {
-    "SMBC": "https://www.smbc-card.com",
-    "MUFG": "https://www.cr.mufg.jp"
-}
-
-REFERRAL_URLS = {
-    "SMBC": os.environ.get("SMBC_REFERRAL_URL"),
-    "MUFG": os.environ.get("MUFG_REFERRAL_URL")
+SEARCH_INDEX_FILE = ROOT_DIR / "search_index.json"
+LOG_DIR = ROOT_DIR / "logs"
+EXTRACT_CACHE_FILE = ROOT_DIR / "extract_cache.json"
+# 実行ごとの店舗の変化を積み上げる履歴（history.py）
+HISTORY_FILE = ROOT_DIR / "history.sqlite3"
+# 店舗の別名の辞書（aliases.py）。辞書にない店舗の分だけ別名を生成する
+ALIAS_FILE = ROOT_DIR / "aliases.json"
+# 別名を生成するときに1回のリクエストにまとめる店舗数
+ALIAS_BATCH_SIZE = 50
+# プロンプトを変更したら上げる（抽出キャッシュを無効化するため）
+PROMPT_VERSION = "4"
+# セクション分割: 行内容のハッシュで境界を決めるので、一部の変更で他のセクションはずれない
+SECTION_MIN_CHARS = 4000
+SECTION_MAX_CHARS = 12000
+SECTION_BOUNDARY_MOD = 16
+# 前のセクションの末尾をこの文字数まで重ねる
+SECTION_OVERLAP_CHARS = 600
+# これより長い行は句点・空白で細かく区切ってからセクションにまとめる
+SECTION_LONG_LINE = 2000
+LONG_LINE_UNIT_RE = re.compile(r"[^。 ]*[。 ]+|[^。 ]+")
+# ページ全体に効く注記（「※商業施設内は対象外」など）。どのセクションのプロンプトにも先頭に付ける
+PAGE_NOTE_RE = re.compile(r"^[※＊*]|^[（(]?注[)）:：\d１-９]|注意事項|ご注意|商業施設")
+PAGE_NOTE_MAX_LINE = 300
+PAGE_CONTEXT_MAX_CHARS = 2000
+# 0 にすると抽出結果をストリーミングせず、まとめて受け取る
+EXTRACT_STREAM = os.environ.get("EXTRACT_STREAM", "1") != "0"
+# 1 にすると、全カードの抽出・キャッチコピー生成を数秒ためて1回のリクエストにまとめる（RPM の節約用）
+# まとめたリクエストが失敗したり、一部のタスクの答えがなかったりした分はカードごとに依頼し直す
+EXTRACT_BATCH = os.environ.get("EXTRACT_BATCH", "0") == "1"
+EXTRACT_BATCH_WINDOW = float(os.environ.get("EXTRACT_BATCH_WINDOW", "5"))
+# 1回にまとめる本文の文字数の上限（超えた分は次のリクエストに回す）
+EXTRACT_BATCH_MAX_CHARS = int(os.environ.get("EXTRACT_BATCH_MAX_CHARS", "120000"))
+STORE_CONDITION_FIELDS = ("payment_method", "mobile_order", "delivery", "note")
+EXTRACT_CONFIG = {
+    "response_mime_type": "application/json",
+    "temperature": 0.0,
+    "safety_settings": [
+        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+    ]
 }
-
-def get_client():
-    global _client
-    if _client:
-        return _client
-    if not API_KEY:
-        print("FATAL ERROR: 'GEMINI_API_KEY' environment variable is missing.", flush=True)
-        sys.exit(1)
-
-    # タイムアウト180秒
-    _client = genai.Client(
-        api_key=API_KEY,
-        http_options=types.HttpOptions(timeout=180000)
-    )
-    return _client
+# 最初の取得時に作る（--check-sources などで使わない場合に作らずに済むように）
+SESSION = None
+_session_lock = threading.Lock()
+_extract_cache_lock = threading.Lock()
+# --profile のときだけ cProfile.Profile のリストになる
+_profilers = None
+# Python 3.12 以降の cProfile は sys.monitoring で全スレッドを記録し、2つ目のプロファイラは有効にできない
+PROFILER_COVERS_THREADS = sys.version_info >= (3, 12)
+# EXTRACT_BATCH のときだけ main が RequestBatcher を入れる
+_batcher = None
+
+URLS = source_field("url")
+OFFICIAL_LINKS = source_field("official_url")
+BASE_DOMAINS = source_field("base_domain")
+REFERRAL_URLS = {card: os.environ.get(source["referral_env"]) for card, source in SOURCES.items()}
+
+# 抽出用テキストのクリーナー（テストで差し替えられるようにモジュール変数にしておく）
+clean_html_aggressive = clean_extract_text
+
+def get_session():
+    global SESSION
+    with _session_lock:
+        if SESSION is None:
+            SESSION = build_session()
+        return SESSION
 
 def load_previous_output():
     if not DATA_FILE.exists():
@@ -74,171 +125,305 @@ def load_previous_output():
         print(f"WARNING: Could not load previous data.json: {e}", flush=True)
         return {}
 
-def fallback_items(card_name, reason):
-    previous = load_previous_output()
-    stores = [
-        deepcopy(item)
-        for item in previous.get("stores", [])
-        if item.get("card_type") == card_name
-    ]
+def index_previous_stores(previous_output):
+    """前回の data.json の店舗を store_key で引けるようにする"""
+    index = {}
+    for item in previous_output.get("stores", []):
+        if isinstance(item, dict) and item.get("name"):
+            index.setdefault(store_key(item), item)
+    return index
+
+def previous_card_stores(card_name, previous_index):
+    # process_card が上書きするのはトップレベルの項目だけなので、浅いコピーで足りる
+    return [dict(item) for key, item in previous_index.items() if key[0] == card_name]
+
+def fallback_items(card_name, reason, previous_index):
+    stores = previous_card_stores(card_name, previous_index)
     if stores:
         print(f"WARNING: Using previous {card_name} data ({len(stores)} items). Reason: {reason}", flush=True)
     else:
         print(f"ERROR: No previous {card_name} data available. Reason: {reason}", flush=True)
     return stores
 
-def read_cached_html(card_name):
+def carry_over_previous(card_name, items, previous_index):
+    # 今回の抽出で欠けていた別名・URL は前回の値を引き継ぐ
+    for item in items:
+        previous = previous_index.get(store_key(item, card_name))
+        if not previous:
+            continue
+        for field in ("aliases", "official_list_url"):
+            if not item.get(field) and previous.get(field):
+                item[field] = deepcopy(previous[field])
+    return items
+
+def change_summary(stores, previous_index):
+    current = {store_key(item): item for item in stores if item.get("name")}
+    summary = {}
+    for card in URLS:
+        summary[card] = {
+            "added": sorted(item["name"] for key, item in current.items() if key[0] == card and key not in previous_index),
+            "removed": sorted(item["name"] for key, item in previous_index.items() if key[0] == card and key not in current),
+            "changed": sorted(
+                item["name"]
+                for key, item in current.items()
+                if key[0] == card and key in previous_index and item.get("conditions") != previous_index[key].get("conditions")
+            ),
+        }
+    return summary
+
+def extraction_cache_key(content):
+    digest = hashlib.sha256()
+    for part in (MODEL_ID, PROMPT_VERSION, content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def source_cache_key(card_name, source_hash):
+    # 本文ハッシュだけで抽出結果を使い回す（304・本文が同じ）ときの鍵。クリーナーやセレクターが変われば一致しない
+    return extraction_cache_key(f"{extract_cleaner_id(card_name)}\0{source_hash}")
+
+def load_extract_cache():
+    if not EXTRACT_CACHE_FILE.exists():
+        return {}
+    try:
+        with EXTRACT_CACHE_FILE.open("r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except Exception as e:
+        print(f"WARNING: Could not load extract cache: {e}", flush=True)
+        return {}
+
+def save_extract_cache(card_name, entry):
+    with _extract_cache_lock:
+        cache = load_extract_cache()
+        cache[card_name] = deepcopy(entry)
+        try:
+            with EXTRACT_CACHE_FILE.open("w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2, sort_keys=True)
+        except Exception as e:
+            print(f"WARNING: Could not write extract cache: {e}", flush=True)
+
+def cached_extraction(entry, key):
+    stores = entry.get("stores")
+    if entry.get("key") != key or not isinstance(stores, list) or not stores:
+        return None
+    return deepcopy(stores)
+
+def _section_units(content):
+    # 行単位で区切る。改行のない長い行（get_text の出力など）は句点・空白の後ろで区切る
+    for line in content.splitlines(keepends=True):
+        if len(line) <= SECTION_LONG_LINE:
+            yield line
+            continue
+        for unit in LONG_LINE_UNIT_RE.findall(line):
+            while len(unit) > SECTION_MAX_CHARS:
+                yield unit[:SECTION_MAX_CHARS]
+                unit = unit[SECTION_MAX_CHARS:]
+            yield unit
+
+def split_sections(content):
+    sections = []
+    current = []
+    size = 0
+    for line in _section_units(content):
+        stripped = line.strip()
+        at_boundary = (
+            size >= SECTION_MIN_CHARS
+            and stripped
+            and zlib.crc32(stripped.encode("utf-8")) % SECTION_BOUNDARY_MOD == 0
+        )
+        if current and (at_boundary or size + len(line) > SECTION_MAX_CHARS):
+            sections.append("".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+def page_context(content):
+    """ページ内のどこにあっても全店舗に効く注記の行を、出てきた順に上限まで集める"""
+    notes = []
+    size = 0
+    for unit in _section_units(content):
+        note = unit.strip()
+        if not note or len(note) > PAGE_NOTE_MAX_LINE or note in notes or not PAGE_NOTE_RE.search(note):
+            continue
+        if size + len(note) > PAGE_CONTEXT_MAX_CHARS:
+            break
+        notes.append(note)
+        size += len(note) + 1
+    return "\n".join(notes)
+
+def section_chunks(sections, context=""):
+    # 境界をまたぐ店舗が切れないよう、直前のセクションの末尾を重ねてプロンプトに入れる
+    # セクションが複数あるときは、ページ全体の注記（context）を各セクションの先頭に付ける
+    header = f"[Page-wide notes (apply to every store)]\n{context}\n[Section]\n" if context and len(sections) > 1 else ""
+    chunks = []
+    previous = ""
+    for section in sections:
+        tail = previous[-SECTION_OVERLAP_CHARS:]
+        if len(previous) > SECTION_OVERLAP_CHARS:
+            # 行（または文）の途中から始めない
+            cut = max(tail.find("\n"), tail.find("。"), tail.find(" "))
+            tail = tail[cut + 1:] if cut >= 0 else ""
+        chunks.append(header + tail + section)
+        previous = section
+    return chunks
+
+def merge_store(base, extra):
+    # 重なり部分で同じ店舗が2回抽出された場合、欠けている項目と別名を補う
+    for field, value in extra.items():
+        if field == "aliases" and isinstance(value, list):
+            aliases = base.get("aliases") if isinstance(base.get("aliases"), list) else []
+            base["aliases"] = aliases + [alias for alias in value if alias not in aliases]
+        elif field == "conditions" and isinstance(value, dict) and isinstance(base.get(field), dict):
+            for key, condition in value.items():
+                if not base[field].get(key):
+                    base[field][key] = condition
+        elif base.get(field) in (None, "", [], {}):
+            base[field] = deepcopy(value)
+
+def merge_section_stores(section_stores):
+    merged = {}
+    for stores in section_stores:
+        for item in stores:
+            if not isinstance(item, dict) or not item.get("name"):
+                continue
+            key = store_key(item)
+            if key in merged:
+                merge_store(merged[key], item)
+            else:
+                merged[key] = deepcopy(item)
+    return list(merged.values())
+
+def trust_local_extract(document, trusted, source):
+    # local_updater が同じページから作った Gemini 用テキストを使い、クリーニングと検証を省く
+    text, valid = trusted
+    document.cleaned = text
+    document.useful = valid
+    count("cache_trusted")
+    print(f"DEBUG: Using local updater's extract text for {document.card_name} ({source}, {len(text)} chars, valid={valid})", flush=True)
+    return document
+
+def read_cached_html(card_name, cleaner=None):
     cache_path = CACHE_DIR / f"{card_name}.html"
     if not cache_path.exists():
         print(f"ERROR: No local cache found at {cache_path}.", flush=True)
-        return ""
+        return None
     try:
-        content = decode_bytes(cache_path.read_bytes())
-        content = repair_mojibake(content)
-        print(f"DEBUG: Local cache loaded ({len(content)} chars)", flush=True)
-        return content
+        with span("cache_read", card_name) as record:
+            raw = cache_path.read_bytes()
+            record["bytes"] = len(raw)
+        document = SourceDocument(card_name, raw=raw, cleaner=cleaner or clean_html_aggressive)
+        trusted = CacheStore(CACHE_DIR).trusted_extract(card_name, extract_cleaner_id(card_name), file_hash=content_hash(raw))
+        if trusted:
+            return trust_local_extract(document, trusted, "cache")
+        print(f"DEBUG: Local cache loaded ({len(document.text)} chars)", flush=True)
+        return document
     except Exception as e:
         print(f"ERROR: Failed to load local cache: {e}", flush=True)
-        return ""
+        return None
 
-def get_source_html(card_name, target_url, cache_only=False):
+def get_source_html(card_name, target_url, cache_only=False, known_hash=None, cleaner=None):
+    # known_hash: 抽出済みの本文ハッシュ。HTTP キャッシュと一致すれば条件付きリクエストにし、
+    #   200 でも本文のハッシュが一致すれば (None, "unchanged") を返す
+    # cleaner: 検証に使うクリーナー（省略時は clean_html_aggressive）
     if not cache_only:
         try:
-            resp = SESSION.get(target_url, headers=headers_for(card_name), timeout=60)
+            request_headers = headers_for(card_name)
+            entry = CacheStore(CACHE_DIR).validators(target_url) if known_hash else {}
+            conditional = bool(entry) and entry.get("body_hash") == known_hash
+            if conditional:
+                request_headers.update(conditional_headers(entry))
+            with span("fetch", card_name, conditional=conditional) as record:
+                resp = polite_get(get_session(), target_url, headers=request_headers, timeout=60, stream=True)
+                record["status"] = resp.status_code
+                record["bytes"] = read_fetched_body(resp)
             print(f"DEBUG: Direct fetch status={resp.status_code} for {card_name}", flush=True)
+            if conditional and resp.status_code == 304:
+                return None, "not_modified"
             resp.raise_for_status()
-            raw_html = decode_response(resp)
-            cleaned = clean_html_aggressive(raw_html, card_name)
-            if is_useful_content(card_name, cleaned):
-                print(f"DEBUG: Direct fetch validated ({len(cleaned)} chars)", flush=True)
-                return raw_html, "direct"
+            # 304 を返さないサーバーでも、本文が抽出済みのものと同じならデコード・クリーニング・検証の前に打ち切る
+            if known_hash and content_hash(resp.content) == known_hash:
+                CacheStore(CACHE_DIR).record_validators(target_url, resp)
+                return None, "unchanged"
+            document = SourceDocument.from_response(card_name, resp, cleaner=cleaner or clean_html_aggressive)
+            trusted = CacheStore(CACHE_DIR).trusted_extract(
+                card_name, extract_cleaner_id(card_name), source_hash=document.source_hash
+            )
+            if trusted:
+                trust_local_extract(document, trusted, "direct")
+            if document.useful:
+                print(f"DEBUG: Direct fetch validated ({len(document.cleaned)} chars)", flush=True)
+                CacheStore(CACHE_DIR).record_validators(target_url, resp)
+                return document, "direct"
             print("WARNING: Direct fetch did not contain expected official content. Checking cache...", flush=True)
         except Exception as e:
             print(f"WARNING: Direct fetch failed ({e}). Checking cache...", flush=True)
     else:
         print(f"DEBUG: Cache-only source check for {card_name}", flush=True)
 
-    cached = read_cached_html(card_name)
-    if not cached:
-        return "", "missing"
+    cached = read_cached_html(card_name, cleaner)
+    if not cached or not cached.text:
+        return None, "missing"
 
-    cleaned_cache = clean_html_aggressive(cached, card_name)
-    if is_useful_content(card_name, cleaned_cache):
-        print(f"DEBUG: Local cache validated ({len(cleaned_cache)} chars)", flush=True)
+    if cached.useful:
+        print(f"DEBUG: Local cache validated ({len(cached.cleaned)} chars)", flush=True)
         return cached, "cache"
 
-    return "", "invalid"
+    return None, "invalid"
 
 def check_sources(cache_only=False):
     ok = True
     for card_name, url in URLS.items():
-        raw_html, source = get_source_html(card_name, url, cache_only=cache_only)
-        if not raw_html:
+        document, source = get_source_html(card_name, url, cache_only=cache_only)
+        if not document:
             print(f"CHECK FAILED: {card_name} source unavailable ({source})", flush=True)
             ok = False
             continue
-        content = clean_html_aggressive(raw_html, card_name)
-        valid = is_useful_content(card_name, content)
-        print(f"CHECK {card_name}: source={source}, chars={len(content)}, valid={valid}", flush=True)
-        ok = ok and valid
+        print(f"CHECK {card_name}: source={source}, chars={len(document.cleaned)}, valid={document.useful}", flush=True)
+        ok = ok and document.useful
     return 0 if ok else 1
 
-def clean_json_text(text):
-    if not text: return "[]"
-    text = re.sub(r'```json\s*', '', text)
-    text = re.sub(r'```\s*', '', text)
-    match = re.search(r'\[.*\]', text, re.DOTALL)
-    if match: return match.group()
-    return text.strip()
-
-def clean_html_aggressive(html_text, card_name=""):
-    """
-    trafilatura を使ってHTMLからメインコンテンツを抽出
-    MUFGの場合はBeautifulSoupで#anc01を抽出して直接返す
-    """
-    if not html_text:
-        return ""
-    
-    # MUFGのみ、BeautifulSoupで#anc01を抽出して直接返す
-    if card_name == "MUFG":
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html_text, 'html.parser')
-            target = soup.select_one('#anc01')
-            if target:
-                section_text = target.get_text(separator=' ', strip=True)
-                print(f"DEBUG: MUFG #anc01 extracted via BeautifulSoup ({len(section_text)} chars)", flush=True)
-                return section_text[:95000]
-        except Exception as e:
-            print(f"WARNING: MUFG CSS selector extraction failed: {e}", flush=True)
-    
-    # trafilatura でメインコンテンツを抽出（テキスト形式）
-    extracted = trafilatura.extract(
-        html_text,
-        output_format="txt",
-        include_tables=True,
-        include_links=True,
-        no_fallback=False
-    )
-    
-    if not extracted:
-        # フォールバック: 元の正規表現ベースのクリーニング
-        print("WARNING: trafilatura extraction failed, using regex fallback", flush=True)
-        blocks_to_kill = r'<(header|footer|nav|noscript|script|style|iframe|svg|aside)[^>]*>.*?</\1>'
-        html_text = re.sub(blocks_to_kill, '', html_text, flags=re.DOTALL | re.IGNORECASE)
-        html_text = re.sub(r'<((?!a\s)[a-z0-9]+)\s+[^>]*>', r'<\1>', html_text, flags=re.IGNORECASE)
-        html_text = re.sub(r'\n+', '\n', html_text)
-        html_text = re.sub(r' +', ' ', html_text)
-        return html_text[:95000].strip()
-    
-    # 文字数制限（Gemini API の制限に合わせる）
-    return extracted[:50000].strip()
-
-def generate_catchphrase(card_name, referral_text):
-    if not referral_text or len(referral_text) < 50:
-        return None
-    print(f">>> Analyzing Referral Content for {card_name}...", flush=True)
-    prompt = f"""
-        あなたは合理的な金融アナリストです。提供された「リファラルサイトのテキスト」のみを解析してください。
+CATCHPHRASE_RULES = """あなたは合理的な金融アナリストです。提供された「リファラルサイトのテキスト」のみを解析してください。
         【タスク】
         このリンク経由でカードを発行した際の「ポイント還元額」や「限定特典」を1つ特定し、短いキャッチコピーを生成せよ。
         【絶対ルール】
         1. 提供されたテキストに記載のない数値を捏造することは厳禁。
         2. あなた自身の知識は一切使わず、目の前のテキストのみを根拠とせよ。
         【出力形式】
-        JSON: {{ "catch": "事実に基づく文言" }}
+        JSON: { "catch": "事実に基づく文言" }"""
+
+def generate_catchphrase(card_name, referral_text):
+    if not referral_text or len(referral_text) < 50:
+        return None
+    print(f">>> Analyzing Referral Content for {card_name}...", flush=True)
+    prompt = f"""
+        {CATCHPHRASE_RULES}
         
         解析対象テキスト:
         {referral_text[:20000]}
     """
     try:
-        response = get_client().models.generate_content(
-            model=MODEL_ID, 
-            contents=prompt,
-            config={"response_mime_type": "application/json", "temperature": 0.0}
+        response = generate(
+            prompt,
+            MODEL_ID,
+            config={"response_mime_type": "application/json", "temperature": 0.0},
+            label=f"{card_name} catchphrase",
+            max_attempts=3,
         )
         return json.loads(response.text).get("catch")
-    except:
-        return None
-
-def fetch_and_extract(card_name, target_url):
-    print(f"\n>>> Processing Official: {card_name}", flush=True)
-    raw_html, source = get_source_html(card_name, target_url)
-    if not raw_html:
-        return fallback_items(card_name, f"source html unavailable ({source})")
+    except GeminiError as e:
+        print(f"WARNING: Catchphrase generation failed for {card_name}: {e}", flush=True)
+    except (ValueError, AttributeError) as e:
+        print(f"WARNING: Catchphrase response for {card_name} was not valid JSON: {e}", flush=True)
+    return None
 
-    content = clean_html_aggressive(raw_html, card_name)
-
-    if len(content) < 100:
-        print("FATAL: Content is empty!", flush=True)
-        return fallback_items(card_name, "cleaned content is empty")
-        
-    with open(ROOT_DIR / f"debug_input_{card_name}.html", "w", encoding="utf-8") as f:
-        f.write(content)
-        
-    prompt = f"""
-        You are an expert data analyst for Japanese credit card rewards (Poi-katsu).
+EXTRACT_RULES = """You are an expert data analyst for Japanese credit card rewards (Poi-katsu).
         Analyze text and extract store data properly.
+        The text may be one excerpt of a longer page. Extract only the stores that appear in it.
 
         【CRITICAL RULES】
         1. **OUTPUT LANGUAGE**: All string values MUST be in **JAPANESE**.
@@ -247,150 +432,523 @@ def fetch_and_extract(card_name, target_url):
            - Example: "ガスト" -> group: "すかいらーくグループ"
            - Example: "セブン-イレブン" -> group: null
 
-        3. **ALIASES (略称)**: You MUST generate a rich list of search keywords, including slang.
-           - **KANJI TO HIRAGANA**: If store name contains Kanji, you MUST include Hiragana reading in aliases.
-           - "吉野家" -> ["よしのや", "吉牛", "よしの家"]
-           - "McDonald's" -> ["マクド", "マック", "Mac", "マクドナルド"]
-           - "Seicomart" -> ["セコマ", "セイコーマート", "せいこーまーと"]
-           - "Seven-Eleven" -> ["セブン", "セブイレ", "セブンイレブン"]
-        
-        4. **MUFG SPECIAL CAUTION (Amex)**: 
+        3. **MUFG SPECIAL CAUTION (Amex)**: 
            - **CRITICAL**: MUFG American Express rules are often NOT in text (provided only via images). 
            - For ALL MUFG stores, you MUST append this warning to `note`: "Amexは条件が異なる可能性があるため公式サイトを確認推奨".
            - Separate rules for Visa/Master/JCB vs Amex if text explicitly mentions it.
 
-        5. **SPECIFIC STORE URLS**:
+        4. **SPECIFIC STORE URLS**:
            - If text provides a specific URL for a store list (e.g., "サイゼリヤの対象店舗一覧はこちら", "ケンタッキー...はこちら"), EXTRACT that specific URL into `official_list_url`.
            - **Saizeriya (SMBC)**: Must link to specific store list URL if found.
            - **KFC (SMBC)**: Must link to specific store list URL if found.
            - If no specific list URL is found, set `official_list_url` to null.
            
-        6. **COMMERCIAL FACILITIES (商業施設)**:
+        5. **COMMERCIAL FACILITIES (商業施設)**:
            - Check for footnotes or warnings about "commercial facilities" (商業施設).
            - If text mentions that stores inside commercial facilities/stations are excluded, you MUST explicitly include "商業施設内の店舗は対象外の場合あり" in `note`.
            - This is highly critical for SMBC related stores.
 
         【Output JSON Schema】
         Return a JSON ARRAY.
-        {{
+        {
             "name": "Store Name (JAPANESE)",
             "group": "Group Name or null (JAPANESE)",
-            "aliases": ["Array", "of", "search", "keywords (Include Hiragana)"],
-            "conditions": {{
+            "conditions": {
                 "payment_method": "String (e.g., 'スマホタッチ決済のみ', '物理カードOK')",
                 "mobile_order": "String (e.g., '対象外', '公式アプリのみ対象')",
                 "delivery": "String (e.g., '対象外', '自社デリバリーは対象')",
                 "note": "String (e.g., '商業施設内は対象外など')"
-            }},
+            },
             "official_list_url": "Specific Store List URL or null"
-        }}
+        }"""
+
+def build_extract_prompt(content):
+    return f"""
+        {EXTRACT_RULES}
 
         Target Text (Cleaned HTML):
         {content}
     """
 
-    max_retries = 5
-    response_text = ""
-
-    for attempt in range(max_retries):
+ALIAS_RULES = """You generate search keywords for Japanese store names (Poi-katsu store search).
+        For EACH store name, list aliases that users may type to find it, including slang.
+        - **KANJI TO HIRAGANA**: If store name contains Kanji, you MUST include Hiragana reading.
+        - "吉野家" -> ["よしのや", "吉牛", "よしの家"]
+        - "McDonald's" -> ["マクド", "マック", "Mac", "マクドナルド"]
+        - "Seicomart" -> ["セコマ", "セイコーマート", "せいこーまーと"]
+        - "Seven-Eleven" -> ["セブン", "セブイレ", "セブンイレブン"]
+        Return ONE JSON OBJECT: { "Store Name exactly as given": ["alias", ...] }"""
+
+def generate_aliases(names):
+    """辞書にない店舗の別名を ALIAS_BATCH_SIZE 件ずつ生成し {店舗名: [別名]} を返す。失敗した分は含めない"""
+    generated = {}
+    for start in range(0, len(names), ALIAS_BATCH_SIZE):
+        batch = names[start:start + ALIAS_BATCH_SIZE]
+        prompt = f"""
+        {ALIAS_RULES}
+
+        Store names:
+        {json.dumps(batch, ensure_ascii=False)}
+    """
         try:
-            print(f"DEBUG: Requesting Gemini... (Attempt {attempt+1})", flush=True)
-            
-            response = get_client().models.generate_content(
-                model=MODEL_ID, 
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "temperature": 0.0,
-                    "safety_settings": [
-                        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-                    ]
-                }
-            )
-            response_text = response.text
-            break 
-
-        except ClientError as e:
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                print(f"WARNING: Rate Limit (429). Sleeping 20s...", flush=True)
-                time.sleep(20)
-                continue
-            else:
-                print(f"CRITICAL API ERROR: {e}", flush=True)
-                return fallback_items(card_name, "Gemini API client error")
-        except Exception as e:
-            print(f"WARNING: Network/Timeout Error ({e}).", flush=True)
-            if attempt < max_retries - 1:
-                print("Retrying in 20s...", flush=True)
-                time.sleep(20)
+            response = generate(prompt, MODEL_ID, config=EXTRACT_CONFIG, label=f"aliases {start // ALIAS_BATCH_SIZE + 1}", max_attempts=3)
+            answer = json.loads(response.text or "")
+        except GeminiError as e:
+            print(f"WARNING: Alias generation failed for {len(batch)} stores: {e}", flush=True)
+            continue
+        except ValueError as e:
+            print(f"WARNING: Alias response was not valid JSON: {e}", flush=True)
+            continue
+        if not isinstance(answer, dict):
+            print("WARNING: Alias response was not a JSON object", flush=True)
+            continue
+        for name in batch:
+            if isinstance(answer.get(name), list):
+                generated[name] = answer[name]
+    return generated
+
+def update_aliases(stores, previous_output):
+    """別名の辞書を stores に反映し、辞書になかった店舗の分だけ生成して辞書を保存する"""
+    dictionary = load_alias_dictionary(ALIAS_FILE)
+    if not dictionary:
+        seed_alias_dictionary(dictionary, previous_output.get("stores", []))
+    missing = apply_alias_dictionary(stores, dictionary)
+    if missing:
+        print(f"DEBUG: Generating aliases for {len(missing)} new stores", flush=True)
+        generated = generate_aliases(missing)
+        for name, aliases in generated.items():
+            add_aliases(dictionary, name, aliases)
+        apply_alias_dictionary(stores, dictionary)
+        print(f"DEBUG: Aliases generated for {len(generated)}/{len(missing)} new stores", flush=True)
+    try:
+        save_alias_dictionary(ALIAS_FILE, dictionary)
+    except Exception as e:
+        print(f"WARNING: Could not write alias dictionary: {e}", flush=True)
+    return len(missing)
+
+def validate_store_item(item):
+    """プロンプトの Output JSON Schema に沿って1件を整える。使えない項目は (None, 理由) を返す"""
+    if not isinstance(item, dict):
+        return None, "item is not an object"
+    name = item.get("name")
+    if not isinstance(name, str) or not name.strip():
+        return None, "item has no name"
+    aliases = item.get("aliases") or []
+    conditions = item.get("conditions") or {}
+    if not isinstance(aliases, list):
+        return None, f"aliases of {name} is not a list"
+    if not isinstance(conditions, dict):
+        return None, f"conditions of {name} is not an object"
+    for field in ("group", "official_list_url"):
+        if item.get(field) is not None and not isinstance(item[field], str):
+            return None, f"{field} of {name} is not a string"
+
+    valid = dict(item)
+    valid["name"] = name.strip()
+    valid["group"] = item.get("group")
+    valid["aliases"] = [alias for alias in aliases if isinstance(alias, str) and alias.strip()]
+    valid["conditions"] = {**{field: None for field in STORE_CONDITION_FIELDS}, **conditions}
+    valid["official_list_url"] = item.get("official_list_url")
+    return valid, None
+
+def request_store_items(card_name, prompt, label):
+    """Gemini に抽出を依頼し (items, error_reason) を返す。items が None なら失敗。
+    応答の途中が壊れていた場合は、読めた分の items と理由の両方を返す"""
+    parser = JsonArrayStream()
+    items = []
+    parts = []
+    broken = []
+    started = time.monotonic()
+
+    def consume(text):
+        parts.append(text)
+        with span("json_parse", card_name, label=label, chars=len(text)) as record:
+            parsed = parser.feed(text)
+            record["items"] = len(parsed)
+        for item in parsed:
+            valid, reason = validate_store_item(item)
+            if valid is None:
+                print(f"WARNING: Skipping invalid item from {label}: {reason}", flush=True)
                 continue
-            else:
-                return fallback_items(card_name, "Gemini request failed after retries")
-    
+            if not items:
+                print(f"DEBUG: First item from {label} after {time.monotonic() - started:.1f}s", flush=True)
+            items.append(valid)
+
     try:
-        with open(ROOT_DIR / f"debug_response_{card_name}.txt", "w", encoding="utf-8") as f:
+        if EXTRACT_STREAM:
+            for text in generate_stream(prompt, MODEL_ID, config=EXTRACT_CONFIG, label=label):
+                consume(text)
+        else:
+            consume(generate(prompt, MODEL_ID, config=EXTRACT_CONFIG, label=label).text or "")
+    except GeminiError as e:
+        if not parts:
+            return None, str(e)
+        broken.append(str(e))
+
+    response_text = "".join(parts)
+    try:
+        with open(ROOT_DIR / f"debug_response_{label}.txt", "w", encoding="utf-8") as f:
             f.write(response_text if response_text else "EMPTY_RESPONSE")
     except:
         pass
 
+    if not parser.complete:
+        # 配列が閉じていない応答は途中で切れているので、読めた分だけ使う
+        if not parser.started:
+            broken.append("no JSON array in response")
+        elif not parser.finished:
+            broken.append("response ended before the closing bracket")
+        broken.extend(parser.errors)
+    if broken:
+        print(f"JSON PARSE ERROR: {label}: {broken[0]} (kept {len(items)} valid items)", flush=True)
+        with open(ROOT_DIR / f"debug_error_{label}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(broken) + "\n\n" + response_text)
+        if not items:
+            return None, "Gemini response was not valid JSON"
+        return items, f"partial response: {broken[0]}"
+    return items, None
+
+def build_batch_prompt(tasks):
+    task_ids = ", ".join(task_id for task_id, _ in tasks)
+    texts = "\n\n".join(
+        f"=== TASK {task_id} ({kind}, {card_name}) ===\n{content}"
+        for task_id, (kind, card_name, content) in tasks
+    )
+    return f"""
+        Several independent tasks follow. Handle each task separately, using only the text of that task.
+        Return ONE JSON OBJECT whose keys are exactly these task ids: {task_ids}
+        - For a "stores" task, the value is the JSON ARRAY described in 【STORE EXTRACTION】.
+        - For a "catch" task, the value is the JSON object described in 【CATCHPHRASE】.
+
+        【STORE EXTRACTION】
+        {EXTRACT_RULES}
+
+        【CATCHPHRASE】
+        {CATCHPHRASE_RULES}
+
+{texts}
+    """
+
+def request_batch(tasks):
+    """RequestBatcher の handler。tasks は [(task_id, (kind, card_name, content))]。
+    stores は (items, None)、catch は {"catch": ...} を返し、答えのなかったタスクは含めない"""
+    if len(tasks) == 1:
+        # 1件だけならまとめる意味がないので、ストリーミングできる通常の依頼に任せる
+        return {}
+    label = "batch " + ",".join(task_id for task_id, _ in tasks)
+    with span("prompt_build", None, label=label, chars=sum(len(content) for _, (_, _, content) in tasks)):
+        prompt = build_batch_prompt(tasks)
     try:
-        cleaned_json = clean_json_text(response_text)
-        data = json.loads(cleaned_json)
-        if not isinstance(data, list) or not data:
-            return fallback_items(card_name, "Gemini response did not contain store items")
-        print(f"SUCCESS: Extracted {len(data)} items for {card_name}", flush=True)
-        return data
-    except Exception as e:
-        print(f"JSON PARSE ERROR: {e}", flush=True)
-        with open(ROOT_DIR / f"debug_error_{card_name}.txt", "w", encoding="utf-8") as f:
-            f.write(str(e) + "\n\n" + response_text)
-        return fallback_items(card_name, "Gemini response was not valid JSON")
+        response = generate(prompt, MODEL_ID, config=EXTRACT_CONFIG, label=label)
+        answers = json.loads(response.text or "")
+    except GeminiError as e:
+        print(f"WARNING: Batched request failed ({e})", flush=True)
+        return {}
+    except ValueError as e:
+        print(f"WARNING: Batched response was not valid JSON: {e}", flush=True)
+        return {}
+    if not isinstance(answers, dict):
+        print("WARNING: Batched response was not a JSON object", flush=True)
+        return {}
+
+    results = {}
+    for task_id, (kind, _, _) in tasks:
+        answer = answers.get(task_id)
+        if kind == "catch":
+            if isinstance(answer, dict):
+                results[task_id] = answer
+            continue
+        if not isinstance(answer, list):
+            continue
+        items = []
+        for item in answer:
+            valid, reason = validate_store_item(item)
+            if valid is None:
+                print(f"WARNING: Skipping invalid item from {task_id}: {reason}", flush=True)
+                continue
+            items.append(valid)
+        results[task_id] = (items, None)
+    missing = [task_id for task_id, _ in tasks if task_id not in results]
+    print(f"DEBUG: Batched {len(tasks)} tasks in one request ({len(missing)} unanswered)", flush=True)
+    return results
+
+def extract_items(card_name, content, label):
+    """1セクション分の抽出。バッチモードなら他のカードの依頼とまとめ、答えがなければ単独で依頼し直す"""
+    if _batcher is not None:
+        result = _batcher.submit(label, ("stores", card_name, content), len(content)).result()
+        if result is not None:
+            return result
+        print(f"DEBUG: {label} was not answered in a batch; requesting it on its own", flush=True)
+    with span("prompt_build", card_name, chars=len(content)):
+        prompt = build_extract_prompt(content)
+    return request_store_items(card_name, prompt, label)
+
+def request_catchphrase(card_name, referral_text):
+    """キャッチコピーの生成を依頼し、結果を返す関数を返す。
+    バッチモードでは抽出より先に依頼しておき、同じリクエストにまとめる"""
+    if _batcher is None or not referral_text or len(referral_text) < 50:
+        return lambda: generate_catchphrase(card_name, referral_text)
+    text = referral_text[:20000]
+    future = _batcher.submit(f"{card_name}_catch", ("catch", card_name, text), len(text))
+
+    def result():
+        answer = future.result()
+        if answer is not None:
+            return answer.get("catch")
+        print(f"DEBUG: {card_name} catchphrase was not answered in a batch; requesting it on its own", flush=True)
+        return generate_catchphrase(card_name, referral_text)
+    return result
+
+def fetch_and_extract(card_name, target_url, previous_index=None):
+    print(f"\n>>> Processing Official: {card_name}", flush=True)
+    if previous_index is None:
+        previous_index = index_previous_stores(load_previous_output())
+    cache_entry = load_extract_cache().get(card_name) or {}
+    known_hash = cache_entry.get("source_hash")
+    # source_key はモデル・プロンプト・クリーナーのバージョン込みなので、変更時は本文が同じでも再抽出される
+    if not known_hash or cache_entry.get("source_key") != source_cache_key(card_name, known_hash):
+        known_hash = None
+
+    document, source = get_source_html(card_name, target_url, known_hash=known_hash)
+    if source in ("not_modified", "unchanged"):
+        cached = cached_extraction(cache_entry, cache_entry.get("key"))
+        if cached is not None:
+            reason = "not modified (304)" if source == "not_modified" else "body unchanged"
+            print(f"SUCCESS: Source {reason}; reusing {len(cached)} cached items for {card_name}", flush=True)
+            return cached
+        document, source = get_source_html(card_name, target_url)
+    if not document:
+        return fallback_items(card_name, f"source html unavailable ({source})", previous_index)
+
+    if known_hash and document.source_hash == known_hash:
+        cached = cached_extraction(cache_entry, cache_entry.get("key"))
+        if cached is not None:
+            print(f"SUCCESS: Source body unchanged; reusing {len(cached)} cached items for {card_name}", flush=True)
+            return cached
+
+    content = document.cleaned
 
-def main():
+    if len(content) < 100:
+        print("FATAL: Content is empty!", flush=True)
+        return fallback_items(card_name, "cleaned content is empty", previous_index)
+        
+    with open(ROOT_DIR / f"debug_input_{card_name}.html", "w", encoding="utf-8") as f:
+        f.write(content)
+        
+    cache_key = extraction_cache_key(content)
+    source_fields = {"source_hash": document.source_hash, "source_key": source_cache_key(card_name, document.source_hash)}
+    cached = cached_extraction(cache_entry, cache_key)
+    if cached is not None:
+        print(f"SUCCESS: Cleaned source unchanged; reusing {len(cached)} cached items for {card_name}", flush=True)
+        save_extract_cache(card_name, {**cache_entry, **source_fields})
+        return cached
+
+    previous_sections = {
+        section.get("key"): section.get("stores")
+        for section in cache_entry.get("sections", [])
+        if isinstance(section, dict) and isinstance(section.get("stores"), list)
+    }
+    sections = split_sections(content)
+    chunks = section_chunks(sections, page_context(content))
+    section_keys = [extraction_cache_key(chunk) for chunk in chunks]
+    results = {
+        index: deepcopy(previous_sections[key])
+        for index, key in enumerate(section_keys)
+        if key in previous_sections
+    }
+    reused = len(results)
+    pending = [index for index in range(len(chunks)) if index not in results]
+
+    def extract_section(index):
+        print(f"DEBUG: {card_name} section {index + 1}/{len(chunks)} changed ({len(chunks[index])} chars)", flush=True)
+        return extract_items(card_name, chunks[index], f"{card_name}_{index + 1}")
+
+    # 変更のあったセクションは並列に抽出する（同時実行数とレートは gemini_client が制御する）
+    errors = []
+    partial = set()
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(GEMINI_CONCURRENCY, len(pending)))) as executor:
+            futures = {index: executor.submit(extract_section, index) for index in pending}
+        for index in pending:
+            stores, error = futures[index].result()
+            if stores is None:
+                errors.append(f"{error} (section {index + 1})")
+                continue
+            results[index] = stores
+            if error:
+                print(f"WARNING: Using {len(stores)} items from a partial response for {card_name} section {index + 1}", flush=True)
+                partial.add(index)
+
+    # 途中で切れた応答のセクションはキャッシュせず、次回もう一度抽出する
+    section_entries = [
+        {"key": section_keys[index], "stores": results[index]}
+        for index in range(len(chunks))
+        if index in results and index not in partial
+    ]
+    if errors:
+        # 成功したセクションだけ保存しておけば、次回はそこを再抽出しなくて済む
+        save_extract_cache(card_name, {"sections": section_entries})
+        if not results:
+            return fallback_items(card_name, "; ".join(errors), previous_index)
+        # 抽出できたセクションの店舗は使い、失敗したセクションにあったかもしれない前回の店舗は残す
+        data = merge_section_stores(results[index] for index in sorted(results))
+        extracted = {store_key(item, card_name) for item in data}
+        kept = [item for item in previous_card_stores(card_name, previous_index) if store_key(item, card_name) not in extracted]
+        print(
+            f"WARNING: {len(errors)} of {len(chunks)} sections failed for {card_name}; "
+            f"using {len(data)} extracted items and keeping {len(kept)} previous items. Reason: {errors[0]}",
+            flush=True,
+        )
+        return data + kept
+
+    data = merge_section_stores(results[index] for index in sorted(results))
+    if not data:
+        return fallback_items(card_name, "Gemini response did not contain store items", previous_index)
+
+    print(
+        f"SUCCESS: Extracted {len(data)} items for {card_name} "
+        f"({len(sections) - reused} sections re-extracted, {reused} reused)",
+        flush=True,
+    )
+    if partial:
+        save_extract_cache(card_name, {"sections": section_entries})
+    else:
+        save_extract_cache(card_name, {"key": cache_key, "sections": section_entries, "stores": data, **source_fields})
+    return data
+
+def fetch_referral_text(card, ref_url):
+    """リファラルページを取得して (本文, レスポンス) を返す。304 なら本文は None"""
+    # キャッチコピー生成に成功したときだけ記録しているので、304 なら前回の meta をそのまま使う
+    ref_headers = headers_for(card)
+    ref_headers.update(conditional_headers(CacheStore(CACHE_DIR).validators(ref_url)))
+    with span("referral_fetch", card) as record:
+        ref_resp = polite_get(get_session(), ref_url, headers=ref_headers, timeout=30, stream=True)
+        record["status"] = ref_resp.status_code
+        record["bytes"] = read_fetched_body(ref_resp)
+    if ref_resp.status_code == 304:
+        print(f"DEBUG: Referral page for {card} not modified (304); keeping previous catchphrase", flush=True)
+        return None, ref_resp
+    ref_resp.raise_for_status()
+    ref_document = SourceDocument.from_response("", ref_resp, cleaner=clean_html_aggressive)
+    return ref_document.cleaned, ref_resp
+
+def process_card(card, url, previous_index):
+    meta_updates = {}
+    ref_url = REFERRAL_URLS.get(card)
+    catch_result = None
+
+    if ref_url and ref_url != "#":
+        meta_updates[f"{card.lower()}_url"] = ref_url
+        try:
+            # バッチモードでは抽出と同じリクエストにまとめられるよう、抽出より先に依頼しておく
+            referral_text, ref_resp = fetch_referral_text(card, ref_url)
+            if referral_text is not None:
+                catch_result = request_catchphrase(card, referral_text)
+        except Exception as e:
+            print(f"REF SCRAPE ERROR ({card}): {e}")
+    else:
+        meta_updates[f"{card.lower()}_url"] = OFFICIAL_LINKS[card]
+
+    items = carry_over_previous(card, fetch_and_extract(card, url, previous_index), previous_index)
+    if items:
+        base_domain = BASE_DOMAINS.get(card, "")
+        for item in items:
+            item["card_type"] = card
+            item["source_url"] = OFFICIAL_LINKS[card]
+            raw_url = item.get("official_list_url")
+            if raw_url and not raw_url.startswith("http"):
+                item["official_list_url"] = urljoin(base_domain, raw_url)
+                print(f"DEBUG: Fixed URL -> {item['official_list_url']}", flush=True)
+
+    if catch_result is not None:
+        try:
+            catch = catch_result()
+            if catch:
+                meta_updates[f"{card.lower()}_catch"] = catch
+                CacheStore(CACHE_DIR).record_validators(ref_url, ref_resp)
+        except Exception as e:
+            print(f"REF SCRAPE ERROR ({card}): {e}")
+
+    return items, meta_updates
+
+def run_card(card, url, previous_index):
+    if _profilers is None or PROFILER_COVERS_THREADS:
+        return process_card(card, url, previous_index)
+    # Python 3.11 以前の cProfile はスレッドごとなので、カードのワーカーにもプロファイラを付ける
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # 別のプロファイラが動いている（sys.monitoring 版）。計測なしで続ける
+        return process_card(card, url, previous_index)
+    _profilers.append(profiler)
+    try:
+        return process_card(card, url, previous_index)
+    finally:
+        profiler.disable()
+
+def start_profiling():
+    global _profilers
+    tracemalloc.start(10)
+    _profilers = [cProfile.Profile()]
+    _profilers[0].enable()
+
+def finish_profiling(stamp):
+    global _profilers
+    _profilers[0].disable()
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    profile_path = LOG_DIR / f"profile_{stamp}.prof"
+    stats = pstats.Stats(*_profilers)
+    _profilers = None
+    stats.dump_stats(profile_path)
+    print(f"\n>>> Profile written to {profile_path} (peak memory {peak / 1024 / 1024:.1f} MiB)", flush=True)
+    stats.sort_stats("cumulative").print_stats(25)
+    top_allocations = [
+        {"where": str(stat.traceback[0]), "bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:10]
+    ]
+    for allocation in top_allocations:
+        print(f"MEMORY: {allocation['bytes'] / 1024:.1f} KiB in {allocation['count']} blocks at {allocation['where']}", flush=True)
+    return {"profile": str(profile_path.name), "peak_memory_bytes": peak, "top_allocations": top_allocations}
+
+def main(profile=False):
+    global _batcher
     print(f"--- INITIALIZING DEBUG SCRAPER (MODEL: {MODEL_ID}) ---", flush=True)
+    started_at = time.strftime("%Y%m%d_%H%M%S")
+    if profile:
+        start_profiling()
 
     final_stores_list = []
+    # 前回の data.json は1回だけ読み、各カードの引き継ぎ・フォールバックで共有する
     previous_output = load_previous_output()
+    previous_index = index_previous_stores(previous_output)
     meta_data = dict(previous_output.get("meta", {}))
 
-    for i, (card, url) in enumerate(URLS.items()):
-        items = fetch_and_extract(card, url)
+    # カードごとに並列実行し、結果は URLS の順番でマージする（出力を決定的に保つ）
+    if EXTRACT_BATCH:
+        _batcher = RequestBatcher(request_batch, EXTRACT_BATCH_WINDOW, EXTRACT_BATCH_MAX_CHARS)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(URLS))) as executor:
+            futures = {card: executor.submit(run_card, card, url, previous_index) for card, url in URLS.items()}
+    finally:
+        _batcher = None
+
+    for card in URLS:
+        try:
+            items, meta_updates = futures[card].result()
+        except Exception as e:
+            print(f"ERROR: {card} pipeline failed: {e}", flush=True)
+            items, meta_updates = fallback_items(card, "card pipeline raised an exception", previous_index), {}
         if items:
-            base_domain = BASE_DOMAINS.get(card, "")
-            for item in items:
-                item["card_type"] = card
-                item["source_url"] = OFFICIAL_LINKS[card]
-                raw_url = item.get("official_list_url")
-                if raw_url and not raw_url.startswith("http"):
-                    item["official_list_url"] = urljoin(base_domain, raw_url)
-                    print(f"DEBUG: Fixed URL -> {item['official_list_url']}", flush=True)
             final_stores_list.extend(items)
-
-        ref_url = REFERRAL_URLS.get(card)
-
-        if ref_url and ref_url != "#":
-            meta_data[f"{card.lower()}_url"] = ref_url
-
-            try:
-                ref_resp = SESSION.get(ref_url, headers=headers_for(card), timeout=30)
-                ref_resp.raise_for_status()
-                ref_text = clean_html_aggressive(decode_response(ref_resp))
-                catch = generate_catchphrase(card, ref_text)
-                if catch:
-                    meta_data[f"{card.lower()}_catch"] = catch
-            except Exception as e:
-                print(f"REF SCRAPE ERROR ({card}): {e}")
-        else:
-            meta_data[f"{card.lower()}_url"] = OFFICIAL_LINKS[card]
-
-        if i < len(URLS) - 1:
-            time.sleep(2)
+        meta_data.update(meta_updates)
 
     if not final_stores_list:
-        final_stores_list = deepcopy(previous_output.get("stores", []))
+        final_stores_list = list(previous_output.get("stores", []))
         print("WARNING: All extraction failed; keeping previous stores data.", flush=True)
 
     final_output = {
@@ -398,18 +956,54 @@ def main():
         "stores": final_stores_list
     }
 
+    with span("aliases", items=len(final_stores_list)) as record:
+        record["new_stores"] = update_aliases(final_stores_list, previous_output)
+
     print(f"\n>>> Total items collected: {len(final_stores_list)}", flush=True)
+    changes = change_summary(final_stores_list, previous_index)
+    for card, change in changes.items():
+        print(
+            f"CHANGES {card}: +{len(change['added'])} -{len(change['removed'])} ~{len(change['changed'])}",
+            flush=True,
+        )
+        for label, names in change.items():
+            if names:
+                print(f"  {label}: {', '.join(names)}", flush=True)
+    stats = call_stats()
+    print(
+        f"DEBUG: Gemini calls={stats['calls']} failed={stats['failed']} retries={stats['retries']} "
+        f"rate_limited={stats['rate_limited']} latency_p50={stats['latency_p50']:.1f}s "
+        f"latency_max={stats['latency_max']:.1f}s",
+        flush=True,
+    )
 
     try:
-        with DATA_FILE.open("w", encoding="utf-8") as f:
-            json.dump(final_output, f, ensure_ascii=False, indent=2)
+        with span("write", items=len(final_stores_list)):
+            written = publish(final_output, DATA_FILE, SEARCH_INDEX_FILE)
         print(f"SUCCESS: 'data.json' created with stores and referral-based meta.", flush=True)
+        print(f"DEBUG: Published {', '.join(path.name for path in written)}", flush=True)
     except Exception as e:
         print(f"FATAL ERROR: Could not write data.json: {e}", flush=True)
         sys.exit(1)
 
+    # 履歴は data.json とは別の記録なので、書けなくても実行は失敗にしない
+    try:
+        with span("history", items=len(final_stores_list)) as record, HistoryStore(HISTORY_FILE) as history:
+            record["run"], _ = history.record_run(final_output)
+    except Exception as e:
+        print(f"WARNING: Could not record store history: {e}", flush=True)
+
+    extra = {"model": MODEL_ID, "items": len(final_stores_list), "changes": changes}
+    extra["gemini"] = {key: value for key, value in stats.items() if key != "per_call"}
+    if profile:
+        extra.update(finish_profiling(started_at))
+    try:
+        report_path = write_report(LOG_DIR, extra)
+        print(f"DEBUG: Run report written to {report_path}", flush=True)
+    except Exception as e:
+        print(f"WARNING: Could not write run report: {e}", flush=True)
 
 if __name__ == "__main__":
     if "--check-sources" in sys.argv:
         sys.exit(check_sources(cache_only="--cache-only" in sys.argv))
-    main()
+    main(profile="--profile" in sys.argv)
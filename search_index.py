@@ -0,0 +1,83 @@
+import json
+
+from scrape_common import content_hash, normalize_search_text
+
+# index.html が data.json と一緒に読み込む検索用インデックス
+# stores_hash: 作ったときの stores の stores_hash（data.json と一致しなければ index.html は使わない）
+# keys: ストアごとの正規化済み検索キー（name / group / aliases / conditions）
+# 1文字・2文字の部分文字列 → ストア番号の転置インデックス（key_postings）は keys から読み込み時に作る
+# （転置インデックスごと配信すると data.min.json より大きくなるため、重い正規化の結果だけを配る）
+SEARCH_INDEX_VERSION = 3
+
+
+def stores_hash(stores):
+    """公開する stores の内容のハッシュ。data.json・data.min.json・search_index.json に同じ値を書く"""
+    return content_hash(json.dumps(stores, ensure_ascii=False, sort_keys=True, separators=(",", ":")))
+
+
+def search_keys(store):
+    conditions = store.get("conditions") or {}
+    values = [store.get("name"), store.get("group"), *(store.get("aliases") or []), *conditions.values()]
+    keys = []
+    for value in values:
+        key = normalize_search_text(value) if isinstance(value, str) else ""
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def key_grams(key):
+    chars = list(key)
+    grams = set(chars)
+    grams.update(a + b for a, b in zip(chars, chars[1:]))
+    return grams
+
+
+def build_search_index(stores):
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "stores_hash": stores_hash(stores),
+        "store_count": len(stores),
+        "keys": [search_keys(store) for store in stores],
+    }
+
+
+def key_postings(keys):
+    """index.html の buildGrams と同じ転置インデックス（1〜2文字 → ストア番号）"""
+    postings = {}
+    for index, store_keys in enumerate(keys):
+        grams = set()
+        for key in store_keys:
+            grams.update(key_grams(key))
+        for gram in grams:
+            postings.setdefault(gram, []).append(index)
+    return postings
+
+
+def candidate_ids(grams, query):
+    chars = list(query)
+    if len(chars) == 1:
+        return grams.get(query, [])
+    best = None
+    for a, b in zip(chars, chars[1:]):
+        ids = grams.get(a + b)
+        if not ids:
+            return []
+        if best is None or len(ids) < len(best):
+            best = ids
+    return best
+
+
+def search_stores(index, raw_query, grams=None):
+    # index.html の検索と同じ動作: 空白区切りの全クエリがいずれかのキーに部分一致するストア
+    queries = [query for query in (normalize_search_text(part) for part in raw_query.split()) if query]
+    if not queries:
+        return []
+    grams = key_postings(index["keys"]) if grams is None else grams
+    candidates = min((candidate_ids(grams, query) for query in queries), key=len)
+    return [
+        store_id
+        for store_id in candidates
+        if all(any(query in key for key in index["keys"][store_id]) for query in queries)
+    ]
+
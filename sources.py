@@ -0,0 +1,38 @@
+# カードごとの取得元の定義。scraper.py / local_updater.py / scrape_common.py / html_select.py はここを参照する
+#   url:          店舗一覧を取得するページ
+#   official_url: data.json の meta・店舗の source_url に載せる公式ページ
+#   base_domain:  相対リンクを絶対 URL にするときの基準
+#   referral_env: リファラル URL を渡す環境変数
+#   headers:      DEFAULT_HEADERS に上書きするリクエストヘッダー
+#   markers:      正しいページなら必ず含まれる文字列（ブロックページ・エラーページの検出用）
+#   selector:     店舗一覧部分の CSS セレクター。None なら trafilatura で本文を抽出する
+SOURCES = {
+    "SMBC": {
+        "url": "https://www.smbc-card.com/mem/wp/vpoint_up_program/index.jsp",
+        "official_url": "https://www.smbc-card.com/mem/wp/vpoint_up_program/index.jsp",
+        "base_domain": "https://www.smbc-card.com",
+        "referral_env": "SMBC_REFERRAL_URL",
+        "headers": {
+            "Referer": "https://www.smbc-card.com/",
+        },
+        "markers": ("Vポイント", "対象店舗", "マクドナルド"),
+        "selector": None,
+    },
+    "MUFG": {
+        "url": "https://www.cr.mufg.jp/mufgcard/point/global/save/convenience_store/index.html",
+        "official_url": "https://www.cr.mufg.jp/mufgcard/point/global/save/convenience_store/index.html",
+        "base_domain": "https://www.cr.mufg.jp",
+        "referral_env": "MUFG_REFERRAL_URL",
+        "headers": {
+            "Referer": "https://www.cr.mufg.jp/",
+            "Sec-Fetch-Site": "same-origin",
+        },
+        "markers": ("三菱UFJ", "対象店舗", "セブン"),
+        "selector": "#anc01",
+    },
+}
+
+
+def source_field(field):
+    """{カード: SOURCES[カード][field]} の辞書（値が None のカードは含めない）"""
+    return {card: source[field] for card, source in SOURCES.items() if source.get(field) is not None}
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from collections import deque
+from pathlib import Path
+
+from publish import expand_payload
+from scrape_common import normalize_search_text
+
+# カード明細（CSV の利用店名）を data.json の店舗に照合する
+#   python statement_matcher.py statement.csv --column 利用店名 --rate SMBC=7 --rate MUFG=5.5 > matched.csv
+# 店舗名・グループ名・別名を normalize_search_text（index.html の normalizeSearchText と同じ）で正規化し、
+# Aho-Corasick オートマトンにまとめて1行を1回なめるだけで全店舗と照合する
+ROOT_DIR = Path(__file__).resolve().parent
+# index.html の還元率の初期値
+DEFAULT_RATES = {"SMBC": 7.0, "MUFG": 5.5}
+# これより短いキーは誤爆が多いので照合に使わない
+MIN_PATTERN_CHARS = 2
+# 同じ長さで一致したときの優先順（小さいほど優先）
+KIND_PRIORITY = {"name": 0, "alias": 1, "group": 2}
+OUTPUT_FIELDS = ("store", "card_type", "rate", "matched")
+
+
+class Automaton:
+    """文字単位の Aho-Corasick。add() で (キー, 値) を登録し、build() のあと matches() で一致を列挙する"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        # そのノードで終わるキーの値 / fail をたどって最初に見つかる、値を持つノード
+        self._value = [None]
+        self._output = [0]
+
+    def add(self, key, value):
+        node = 0
+        for char in key:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._value.append(None)
+                self._output.append(0)
+            node = child
+        self._value[node] = value
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._output[child] = fail if self._value[fail] is not None else self._output[fail]
+
+    def matches(self, text):
+        """(終了位置, 値) を、同じ位置では長いキーから順に返す"""
+        goto, fail, value, output = self._goto, self._fail, self._value, self._output
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = node if value[node] is not None else output[node]
+            while hit:
+                yield end, value[hit]
+                hit = output[hit]
+
+
+def store_patterns(store):
+    yield "name", store.get("name")
+    for alias in store.get("aliases") or []:
+        yield "alias", alias
+    yield "group", store.get("group")
+
+
+class StoreMatcher:
+    def __init__(self, stores, rates=None, min_chars=MIN_PATTERN_CHARS):
+        self.stores = stores
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        # 正規化したキー → [(優先度, 店舗番号, 元の文字列)]
+        patterns = {}
+        for store_id, store in enumerate(stores):
+            for kind, text in store_patterns(store):
+                key = normalize_search_text(text) if isinstance(text, str) else ""
+                if len(key) >= min_chars:
+                    patterns.setdefault(key, []).append((KIND_PRIORITY[kind], store_id, text))
+        self.automaton = Automaton()
+        for key, entries in patterns.items():
+            self.automaton.add(key, (len(key), sorted(entries)))
+        self.automaton.build()
+        self.pattern_count = len(patterns)
+
+    def rate(self, store):
+        return self.rates.get(store.get("card_type"), 0.0)
+
+    def match(self, text):
+        """text に含まれる店舗のうち、店舗名・別名で最も長く一致したもの（同じ長さなら店舗名 > 別名、
+        さらに還元率の高いカード）を返す。グループ名は店舗名・別名で一致しなかったときだけ使う。なければ None"""
+        best = None
+        for _, (length, entries) in self.automaton.matches(normalize_search_text(text)):
+            priority = entries[0][0]
+            candidates = [entry for entry in entries if entry[0] == priority]
+            store_id, matched = max(
+                ((store_id, matched) for _, store_id, matched in candidates),
+                key=lambda candidate: self.rate(self.stores[candidate[0]]),
+            )
+            rank = (priority < KIND_PRIORITY["group"], length, -priority, self.rate(self.stores[store_id]))
+            if best is None or rank > best[0]:
+                best = (rank, store_id, matched)
+        if best is None:
+            return None
+        store = self.stores[best[1]]
+        return {"store": store.get("name"), "card_type": store.get("card_type"), "rate": self.rate(store), "matched": best[2]}
+
+
+def load_stores(path):
+    with Path(path).open("r", encoding="utf-8") as f:
+        payload = json.load(f)
+    if "strings" in payload:
+        # data.min.json（publish.compact_payload の形式）
+        payload = expand_payload(payload)
+    return payload.get("stores", [])
+
+
+def parse_rate(value):
+    card, _, rate = value.partition("=")
+    try:
+        return card.strip(), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected CARD=RATE, got {value!r}") from None
+
+
+def column_index(header, column):
+    if column.isdigit():
+        return int(column)
+    if header is None or column not in header:
+        raise SystemExit(f"column {column!r} not found in CSV header")
+    return header.index(column)
+
+
+def match_rows(matcher, rows, column, has_header):
+    """CSV の行を1行ずつ読み、照合結果の列を後ろに足した行を返すジェネレーター"""
+    rows = iter(rows)
+    header = next(rows, None) if has_header else None
+    index = column_index(header, column)
+    if header is not None:
+        yield header + list(OUTPUT_FIELDS)
+    for row in rows:
+        result = matcher.match(row[index]) if index < len(row) else None
+        yield row + ([result[field] for field in OUTPUT_FIELDS] if result else [""] * len(OUTPUT_FIELDS))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Match card statement lines (CSV) against stores in data.json")
+    parser.add_argument("statement", nargs="?", default="-", help="CSV file (default: stdin)")
+    parser.add_argument("--data", type=Path, default=ROOT_DIR / "data.json", help="data.json or data.min.json")
+    parser.add_argument("--column", default="0", help="merchant column: header name or 0-based index")
+    parser.add_argument("--no-header", action="store_true", help="the CSV has no header row")
+    parser.add_argument("--rate", action="append", type=parse_rate, default=[], metavar="CARD=RATE")
+    parser.add_argument("--encoding", default="utf-8-sig", help="statement encoding (e.g. cp932)")
+    args = parser.parse_args(argv)
+
+    matcher = StoreMatcher(load_stores(args.data), dict(args.rate))
+    from_stdin = args.statement == "-"
+    # 標準入力も --encoding で読む（BOM・cp932 の明細をパイプで渡せるように）。sys.stdin 自体は閉じない
+    if from_stdin:
+        source = io.TextIOWrapper(sys.stdin.buffer, encoding=args.encoding, newline="")
+    else:
+        source = open(args.statement, "r", encoding=args.encoding, newline="")
+    try:
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        for row in match_rows(matcher, csv.reader(source), args.column, not args.no_header):
+            writer.writerow(row)
+    finally:
+        if from_stdin:
+            source.detach()
+        else:
+            source.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
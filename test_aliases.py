@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from aliases import (
+    apply_alias_dictionary,
+    load_alias_dictionary,
+    merge_aliases,
+    save_alias_dictionary,
+    seed_alias_dictionary,
+)
+
+
+class AliasDictionaryTests(unittest.TestCase):
+    def test_merge_keeps_order_and_drops_normalized_duplicates(self):
+        merged = merge_aliases("マクドナルド", ["マクド", "マック"], ["まくど", "Mac", "ﾏｸﾄﾞﾅﾙﾄﾞ", "", 3, "マック "])
+
+        self.assertEqual(merged, ["マクド", "マック", "Mac"])
+
+    def test_known_stores_reuse_aliases_and_only_new_ones_are_missing(self):
+        dictionary = seed_alias_dictionary({}, [{"name": "吉野家", "aliases": ["よしのや", "吉牛"]}])
+        stores = [
+            {"name": "吉野家", "aliases": []},
+            {"name": "吉野家", "aliases": ["よしの家"]},
+            {"name": "ガスト", "aliases": []},
+            {"name": "ｶﾞｽﾄ", "aliases": []},
+        ]
+
+        missing = apply_alias_dictionary(stores, dictionary)
+
+        self.assertEqual(missing, ["ガスト"])
+        self.assertEqual(stores[0]["aliases"], ["よしのや", "吉牛"])
+        self.assertEqual(stores[1]["aliases"], ["よしのや", "吉牛", "よしの家"])
+        # 一度採用した別名は次の店舗にも引き継がれる
+        self.assertEqual(dictionary["吉野家"]["aliases"], ["よしのや", "吉牛", "よしの家"])
+        self.assertNotIn("がすと", dictionary)
+
+    def test_stores_with_extracted_aliases_are_not_missing(self):
+        dictionary = {}
+        stores = [{"name": "バーミヤン", "aliases": ["Bamiyan"]}, {"name": "ジョナサン", "aliases": ["ジョナサン"]}]
+
+        missing = apply_alias_dictionary(stores, dictionary)
+
+        # 新しい店舗でも別名がそろっていれば生成しない（店舗名と同じ別名しかなければ生成する）
+        self.assertEqual(missing, ["ジョナサン"])
+        self.assertEqual(stores[0]["aliases"], ["Bamiyan"])
+        # stores の別名と辞書のリストは別のオブジェクト
+        stores[0]["aliases"].append("中華")
+        self.assertEqual(dictionary["ばーみやん"]["aliases"], ["Bamiyan"])
+
+    def test_round_trip_and_unsupported_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "aliases.json"
+            dictionary = seed_alias_dictionary({}, [{"name": "セブン-イレブン", "aliases": ["セブン"]}])
+            save_alias_dictionary(path, dictionary)
+            self.assertEqual(load_alias_dictionary(path), dictionary)
+
+            path.write_text('{"version": 0, "stores": {}}', encoding="utf-8")
+            self.assertEqual(load_alias_dictionary(path), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
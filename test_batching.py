@@ -0,0 +1,49 @@
+import threading
+import unittest
+
+from batching import RequestBatcher
+
+
+class RequestBatcherTests(unittest.TestCase):
+    def test_requests_within_window_share_one_call(self):
+        calls = []
+
+        def handler(tasks):
+            calls.append([key for key, _ in tasks])
+            return {key: payload * 2 for key, payload in tasks if key != "c"}
+
+        batcher = RequestBatcher(handler, window=0.05)
+        futures = [batcher.submit(key, index) for index, key in enumerate("abc")]
+
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 2, None])
+        self.assertEqual(calls, [["a", "b", "c"]])
+
+    def test_size_limit_starts_a_new_batch(self):
+        calls = []
+        done = threading.Event()
+
+        def handler(tasks):
+            calls.append([key for key, _ in tasks])
+            if len(calls) == 2:
+                done.set()
+            return {key: True for key, _ in tasks}
+
+        batcher = RequestBatcher(handler, window=0.05, max_size=10)
+        futures = [batcher.submit(key, None, size) for key, size in (("a", 6), ("b", 3), ("c", 6))]
+
+        self.assertTrue(all(future.result(timeout=5) for future in futures))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sorted(calls), [["a", "b"], ["c"]])
+
+    def test_handler_error_resolves_all_futures_with_none(self):
+        def handler(tasks):
+            raise RuntimeError("boom")
+
+        batcher = RequestBatcher(handler, window=0.01)
+        future = batcher.submit("a", None)
+
+        self.assertIsNone(future.result(timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import local_updater
+import scraper
+from cache_store import CacheStore
+from cleaners import CACHE_CLEANER_VERSION, extract_cleaner_id
+from fake_http import FakeResponse
+from scrape_common import content_hash
+
+RAW = "<html><body><section id='anc01'>三菱UFJ 対象店舗 セブン" + "あ" * 600 + "</section></body></html>"
+
+
+class CacheStoreTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = CacheStore(Path(tmp.name) / "html_cache")
+
+    def save(self, html="<p>cleaned</p>\n", extract_text="抽出テキスト"):
+        return self.store.save(
+            "MUFG",
+            html,
+            extract={"text": extract_text, "cleaner": extract_cleaner_id("MUFG"), "valid": True},
+            url="https://example.com",
+            source_hash=content_hash(RAW),
+            cleaner=CACHE_CLEANER_VERSION,
+        )
+
+    def test_trusts_extract_for_matching_file_or_source(self):
+        entry = self.save()
+
+        cleaner = extract_cleaner_id("MUFG")
+        self.assertEqual(self.store.trusted_extract("MUFG", cleaner, file_hash=entry["file_hash"]), ("抽出テキスト", True))
+        self.assertEqual(self.store.trusted_extract("MUFG", cleaner, source_hash=content_hash(RAW)), ("抽出テキスト", True))
+        self.assertIsNone(self.store.trusted_extract("MUFG", cleaner, source_hash=content_hash("changed")))
+        self.assertIsNone(self.store.trusted_extract("MUFG", "0:other", file_hash=entry["file_hash"]))
+        self.assertIsNone(self.store.trusted_extract("SMBC", cleaner, file_hash=entry["file_hash"]))
+
+    def test_edited_files_are_not_trusted(self):
+        entry = self.save()
+        (self.store.directory / entry["extract"]["file"]).write_text("手で書き換えた", encoding="utf-8")
+
+        self.assertIsNone(self.store.trusted_extract("MUFG", extract_cleaner_id("MUFG"), file_hash=entry["file_hash"]))
+        self.assertFalse(self.store.is_current("MUFG", CACHE_CLEANER_VERSION, extract_cleaner_id("MUFG")))
+
+    def test_is_current_checks_cleaner_version_and_file(self):
+        self.save()
+
+        self.assertTrue(self.store.is_current("MUFG", CACHE_CLEANER_VERSION, extract_cleaner_id("MUFG")))
+        self.assertFalse(self.store.is_current("MUFG", "0"))
+        self.store.html_path("MUFG").write_text("<p>edited</p>\n", encoding="utf-8")
+        self.assertFalse(self.store.is_current("MUFG", CACHE_CLEANER_VERSION))
+
+    def test_unsupported_index_is_ignored(self):
+        self.store.directory.mkdir(parents=True)
+        self.store.index_path.write_text('{"version": 0, "entries": {"MUFG": {}}}', encoding="utf-8")
+
+        self.assertEqual(self.store.entry("MUFG"), {})
+
+    def test_scraper_validators_are_kept_apart_from_saved_pages(self):
+        entry = self.save()
+        self.store.record_validators("https://example.com", FakeResponse(200, RAW.encode("utf-8"), {"ETag": '"live"'}))
+
+        self.assertEqual(self.store.entry("MUFG"), entry)
+        self.assertEqual(self.store.validators("https://example.com")["etag"], '"live"')
+        self.assertEqual(self.store.validators("https://example.com")["body_hash"], content_hash(RAW))
+        self.save()
+        self.assertEqual(self.store.validators("https://example.com")["etag"], '"live"')
+
+
+class CacheEntryPointTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = Path(tmp.name) / "html_cache"
+        for target, name, value in (
+            (local_updater, "STORE", CacheStore(self.cache_dir)),
+            (scraper, "CACHE_DIR", self.cache_dir),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_scraper_uses_local_updater_extract_without_cleaning(self):
+        response = FakeResponse(200, RAW.encode("utf-8"), {"ETag": '"v1"'})
+        with mock.patch.object(local_updater.SESSION, "get", return_value=response):
+            self.assertTrue(local_updater.fetch_and_save("MUFG", "https://example.com"))
+
+        with mock.patch.object(scraper, "clean_html_aggressive") as cleaner:
+            document, source = scraper.get_source_html("MUFG", "https://example.com", cache_only=True)
+
+        cleaner.assert_not_called()
+        self.assertEqual(source, "cache")
+        self.assertTrue(document.cleaned.startswith("三菱UFJ 対象店舗 セブン"))
+
+    def test_local_updater_skips_unchanged_source(self):
+        sent_headers = []
+
+        def fake_get(url, headers=None, timeout=None, **kwargs):
+            sent_headers.append(headers)
+            return FakeResponse(200, RAW.encode("utf-8"), {"ETag": '"v1"'})
+
+        with mock.patch.object(local_updater.SESSION, "get", side_effect=fake_get), \
+                mock.patch.object(local_updater, "clean_html_aggressive", wraps=local_updater.clean_html_aggressive) as cleaner:
+            local_updater.fetch_and_save("MUFG", "https://example.com")
+            local_updater.fetch_and_save("MUFG", "https://example.com")
+
+        self.assertEqual(cleaner.call_count, 1)
+        self.assertNotIn("If-None-Match", sent_headers[0])
+        self.assertEqual(sent_headers[1]["If-None-Match"], '"v1"')
+
+
+if __name__ == "__main__":
+    unittest.main()
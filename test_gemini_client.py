@@ -0,0 +1,121 @@
+import unittest
+from unittest import mock
+
+from google.genai.errors import ClientError, ServerError
+
+import gemini_client
+
+
+RATE_LIMIT_BODY = {
+    "error": {
+        "code": 429,
+        "status": "RESOURCE_EXHAUSTED",
+        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "17s"}],
+    }
+}
+
+
+class FakeModels:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def generate_content_stream(self, model, contents, config=None):
+        # outcome はチャンクのリスト。例外はその位置で送出する（先頭なら接続エラー扱い）
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        for chunk in outcome:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield mock.Mock(text=chunk, usage_metadata=None)
+
+
+class GeminiClientTests(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            mock.patch.object(gemini_client, "limiter", mock.Mock(**{"acquire.return_value": 0.0})),
+            mock.patch.object(gemini_client.time, "sleep"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleep = gemini_client.time.sleep
+
+    def use_outcomes(self, *outcomes):
+        models = FakeModels(outcomes)
+        client = mock.Mock(models=models)
+        patcher = mock.patch.object(gemini_client, "get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return models
+
+    def test_reads_retry_delay_from_error_details(self):
+        self.assertEqual(gemini_client.retry_hint(ClientError(429, RATE_LIMIT_BODY)), 17.0)
+        self.assertIsNone(gemini_client.retry_hint(ClientError(400, {"error": {"code": 400}})))
+
+    def test_rate_limit_waits_for_server_hint(self):
+        models = self.use_outcomes(ClientError(429, RATE_LIMIT_BODY), "ok")
+
+        self.assertEqual(gemini_client.generate("prompt", "model"), "ok")
+        self.assertEqual(models.calls, 2)
+        delay = self.sleep.call_args[0][0]
+        self.assertGreaterEqual(delay, 17.0)
+        self.assertLess(delay, 18.0)
+
+    def test_server_errors_back_off_then_give_up(self):
+        error = ServerError(503, {"error": {"code": 503}})
+        models = self.use_outcomes(error, error, error)
+
+        with self.assertRaises(gemini_client.GeminiError):
+            gemini_client.generate("prompt", "model", max_attempts=3)
+        self.assertEqual(models.calls, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_client_errors_are_not_retried(self):
+        models = self.use_outcomes(ClientError(400, {"error": {"code": 400}}))
+
+        with self.assertRaises(gemini_client.GeminiError):
+            gemini_client.generate("prompt", "model")
+        self.assertEqual(models.calls, 1)
+
+    def test_stream_retries_before_first_chunk(self):
+        models = self.use_outcomes(ServerError(503, {"error": {"code": 503}}), ["[", "{}]"])
+
+        chunks = list(gemini_client.generate_stream("prompt", "model"))
+
+        self.assertEqual(chunks, ["[", "{}]"])
+        self.assertEqual(models.calls, 2)
+
+    def test_stream_interrupted_after_first_chunk_is_not_retried(self):
+        models = self.use_outcomes(["[{}", ServerError(503, {"error": {"code": 503}})], ["[]"])
+        received = []
+
+        with self.assertRaises(gemini_client.GeminiError):
+            for chunk in gemini_client.generate_stream("prompt", "model"):
+                received.append(chunk)
+        self.assertEqual(received, ["[{}"])
+        self.assertEqual(models.calls, 1)
+
+    def test_token_bucket_waits_for_refill(self):
+        clock = [100.0]
+        self.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+        with mock.patch.object(gemini_client.time, "monotonic", side_effect=lambda: clock[0]):
+            limiter = gemini_client.RateLimiter(rpm=60, tpm=1200)
+            limiter._requests = 0
+            limiter._tokens = 0
+
+            self.assertAlmostEqual(limiter.acquire(tokens=10), 1.0)
+            self.assertAlmostEqual(limiter.acquire(tokens=1200), 59.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from copy import deepcopy
+from pathlib import Path
+
+from history import HistoryStore
+from search_index import stores_hash
+
+FIRST = {
+    "meta": {"smbc_catch": "新規入会で最大"},
+    "stores": [
+        {"name": "セブン-イレブン", "card_type": "SMBC", "conditions": {"note": "タッチ決済のみ"}},
+        {"name": "ガスト", "card_type": "SMBC", "conditions": {"note": ""}},
+        {"name": "セブン-イレブン", "card_type": "MUFG", "conditions": {"note": ""}},
+    ],
+}
+
+
+class HistoryStoreTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.history = HistoryStore(Path(tmp.name) / "history.sqlite3")
+        self.addCleanup(self.history.close)
+
+    def test_records_only_changes_and_rebuilds_each_run(self):
+        second = deepcopy(FIRST)
+        second["stores"][0]["conditions"]["note"] = "モバイルオーダーも対象"
+        del second["stores"][1]
+        second["stores"].append({"name": "バーミヤン", "card_type": "SMBC", "conditions": {"note": ""}})
+
+        first_run, _ = self.history.record_run(FIRST)
+        second_run, changes = self.history.record_run(second)
+        third_run, unchanged = self.history.record_run(second)
+
+        self.assertEqual(changes, {"SMBC": {"added": ["バーミヤン"], "removed": ["ガスト"], "changed": ["セブン-イレブン"]}})
+        self.assertEqual(unchanged, {})
+        self.assertEqual(self.history.runs()[-1]["changes"], 0)
+        self.assertEqual(self.history.snapshot(first_run), {**FIRST, "stores_hash": stores_hash(FIRST["stores"])})
+        self.assertEqual(self.history.snapshot(), {**second, "stores_hash": stores_hash(second["stores"])})
+        self.assertEqual(self.history.diff(first_run, third_run), changes)
+
+    def test_timeline_follows_a_store_by_normalized_name(self):
+        self.history.record_run(FIRST)
+        self.history.record_run({"meta": {}, "stores": FIRST["stores"][1:]})
+        self.history.record_run(FIRST)
+
+        timeline = self.history.timeline("ｾﾌﾞﾝｲﾚﾌﾞﾝ", card_type="SMBC")
+
+        self.assertEqual([event["event"] for event in timeline], ["added", "removed", "added"])
+        self.assertEqual([event["run"] for event in timeline], [1, 2, 3])
+        self.assertEqual(timeline[-1]["store"], FIRST["stores"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import html_select
+
+PAGE = """<html><body>
+<div class="header">メニュー</div>
+<section id="anc01" class="store-list main">
+  <h2>対象店舗</h2>
+  <script>var ignored = 1;</script><style>.x {}</style>
+  <!-- コメント -->
+  <ul><li>セブン-イレブン</li><li>ローソン &amp; ナチュラルローソン</li></ul>
+  <p>　※一部対象外の店舗があります<br>詳しくはこちら</p>
+</section>
+<div id="anc02">別のセクション</div>
+</body></html>"""
+
+
+class HtmlSelectTests(unittest.TestCase):
+    def test_lxml_matches_beautifulsoup_text(self):
+        for selector in ("#anc01", "section#anc01", ".store-list", "section.main ul", "li", "#anc02"):
+            self.assertEqual(
+                html_select.select_text_lxml(PAGE, selector),
+                html_select.select_text_bs4(PAGE, selector),
+                selector,
+            )
+
+    def test_skips_script_style_and_comments(self):
+        text = html_select.select_text(PAGE, "#anc01")
+
+        self.assertTrue(text.startswith("対象店舗 セブン-イレブン ローソン & ナチュラルローソン"))
+        self.assertNotIn("ignored", text)
+        self.assertNotIn("コメント", text)
+
+    def test_missing_section_returns_none(self):
+        self.assertIsNone(html_select.select_text(PAGE, "#anc99"))
+
+    def test_complex_selector_falls_back_to_beautifulsoup(self):
+        self.assertIsNone(html_select.selector_xpath("ul > li:nth-of-type(2)"))
+        self.assertEqual(html_select.select_text(PAGE, "ul > li:nth-of-type(2)"), "ローソン & ナチュラルローソン")
+
+
+if __name__ == "__main__":
+    unittest.main()
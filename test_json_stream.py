@@ -0,0 +1,58 @@
+import json
+import unittest
+
+from json_stream import JsonArrayStream
+
+
+ITEMS = [
+    {"name": "セブン-イレブン", "aliases": ["セブン", "[括弧]"], "conditions": {"note": "\"引用\" と \\ と }"}},
+    {"name": "マクドナルド", "group": None, "aliases": []},
+]
+
+
+def feed_all(chunks):
+    parser = JsonArrayStream()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return parser, items
+
+
+class JsonArrayStreamTests(unittest.TestCase):
+    def test_every_split_point_gives_same_items(self):
+        text = "```json\n" + json.dumps(ITEMS, ensure_ascii=False) + "\n```"
+        for split in range(len(text) + 1):
+            parser, items = feed_all([text[:split], text[split:]])
+            self.assertEqual(items, ITEMS, split)
+            self.assertTrue(parser.complete)
+
+    def test_items_arrive_before_array_closes(self):
+        parser = JsonArrayStream()
+
+        self.assertEqual(parser.feed('[{"name": "A"}, {"name": "B'), [{"name": "A"}])
+        self.assertEqual(parser.feed('"}'), [{"name": "B"}])
+        self.assertFalse(parser.finished)
+
+    def test_broken_item_is_skipped(self):
+        parser, items = feed_all(['[{"name": "A"}, {"name": }, {"name": "C"}]'])
+
+        self.assertEqual(items, [{"name": "A"}, {"name": "C"}])
+        self.assertEqual(len(parser.errors), 1)
+        self.assertFalse(parser.complete)
+
+    def test_truncated_tail_keeps_finished_items(self):
+        parser, items = feed_all(['[{"name": "A"}, {"name": "B", "aliases": ["b'])
+
+        self.assertEqual(items, [{"name": "A"}])
+        self.assertTrue(parser.started)
+        self.assertFalse(parser.finished)
+
+    def test_text_without_array(self):
+        parser, items = feed_all(["申し訳ありませんが、抽出できませんでした。"])
+
+        self.assertEqual(items, [])
+        self.assertFalse(parser.started)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import random
+import re
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import local_updater
+from fake_http import FakeResponse
+
+ROOT_DIR = Path(__file__).resolve().parent
+CACHE_DIRS = (ROOT_DIR / "html_cache",)
+
+
+def legacy_clean_html(html_text):
+    # 1パス化する前の実装（出力が変わっていないことの確認用）
+    if not html_text: return ""
+    blocks_to_kill = r'<(header|footer|nav|noscript|script|style|iframe|svg|aside)[^>]*>.*?</\1>'
+    html_text = re.sub(blocks_to_kill, '', html_text, flags=re.DOTALL | re.IGNORECASE)
+    html_text = re.sub(r'<!--.*?-->', '', html_text, flags=re.DOTALL)
+    html_text = re.sub(r'<((?!a\s)[a-z0-9]+)\s+[^>]*>', r'<\1>', html_text, flags=re.IGNORECASE)
+    attrs_to_remove = ['class', 'id', 'style', 'target', 'rel', 'onclick', 'data-[a-z0-9-]+', 'aria-[a-z-]+', 'role']
+    for attr in attrs_to_remove:
+        html_text = re.sub(r'\s+' + attr + r'="[^"]*"', '', html_text, flags=re.IGNORECASE)
+        html_text = re.sub(r'\s+' + attr + r"='[^']*'", '', html_text, flags=re.IGNORECASE)
+    tags_to_strip = ['div', 'span', 'section', 'article', 'main', 'body', 'html', 'head']
+    for tag in tags_to_strip:
+        html_text = re.sub(r'<' + tag + r'[^>]*>', '', html_text, flags=re.IGNORECASE)
+        html_text = re.sub(r'</' + tag + r'>', '\n', html_text, flags=re.IGNORECASE)
+    html_text = re.sub(r'\n+', '\n', html_text)
+    html_text = re.sub(r' +', ' ', html_text)
+    html_text = "\n".join(line.rstrip() for line in html_text.splitlines())
+    return html_text[:95000].strip() + "\n"
+
+
+TAGS = ["div", "DIV", "span", "p", "a", "A", "section", "header", "footer", "nav", "script", "style", "svg",
+        "noscript", "aside", "li", "td", "img", "br", "html", "head", "body", "main", "abbr", "divx", "headerx", "my-el"]
+ATTRS = ["class", "CLASS", "id", "style", "target", "rel", "onclick", "data-x", "data-cmp-data-layer",
+         "aria-label", "role", "href", "src", "title"]
+VALUES = ['"x"', "'y'", '"a>b"', '"{&#34;k&#34;:&lt;/p>}"', '"  spaced  value "', "z", '"<span>"']
+TEXTS = ["店舗", "  ", "\n", "\n\n", "\r\n", " \t ", "&amp;", "　", "\xa0", ' class="t"', " x ", " id='q' ", "-->", "<!--"]
+
+
+def random_html(rng, depth=0):
+    parts = []
+    for _ in range(rng.randint(1, 5)):
+        roll = rng.random()
+        if roll < 0.35 or depth > 3:
+            parts.append(rng.choice(TEXTS))
+        elif roll < 0.45:
+            # コメントとブロックが重なる場合（<!--<script>-->x</script> など）も旧実装と同じ順で消えること
+            body = rng.choice(["c", "<div>", " x ", "<script>", "</script>", "<nav class='n'>", "</style>", ""])
+            parts.append("<!--" + body + rng.choice(["-->", "-->", ""]))
+        else:
+            tag = rng.choice(TAGS)
+            attrs = "".join(
+                rng.choice([" ", "\n"]) + rng.choice(ATTRS) + rng.choice(["=", ""]) + rng.choice(VALUES)
+                for _ in range(rng.randint(0, 3))
+            )
+            close = "" if rng.random() < 0.1 else f"</{tag}>"
+            parts.append(f"<{tag}{attrs}>" + random_html(rng, depth + 1) + close)
+    return "".join(parts)
+
+
+class CleanHtmlTests(unittest.TestCase):
+    def test_matches_legacy_cleaner_on_cached_pages(self):
+        for cache_dir in CACHE_DIRS:
+            for path in sorted(cache_dir.glob("*.html")):
+                text = path.read_text(encoding="utf-8")
+                self.assertEqual(local_updater.clean_html_aggressive(text), legacy_clean_html(text), path)
+
+    def test_matches_legacy_cleaner_on_raw_markup(self):
+        html = (
+            '<html lang="ja"><head><script>var a = "</div>";</script></head><body class="x">\n'
+            '<div class="wrap" data-cmp-data-layer="{&#34;t&#34;:&#34;&lt;p>&#34;}">\n'
+            '  <p id="lead" style="color:red">対象店舗  で　還元</p><!-- memo -->  class="left"\n'
+            '  <a href="/list" class="btn" target="_blank" rel="noopener">一覧はこちら</a>\n'
+            '  <header>unclosed <nav>メニュー</nav></div></body></html>'
+            '<!--<script>-->x</script> <script><!--</script>--> <div class="a"><!-- <style> -->y</style></div>'
+        )
+        self.assertEqual(local_updater.clean_html_aggressive(html), legacy_clean_html(html))
+
+    def test_matches_legacy_cleaner_on_random_markup(self):
+        rng = random.Random(20240601)
+        for _ in range(1500):
+            html = random_html(rng)
+            self.assertEqual(local_updater.clean_html_aggressive(html), legacy_clean_html(html), repr(html))
+
+
+class FetchAndSaveTests(unittest.TestCase):
+    def test_not_modified_and_error_responses_are_closed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = local_updater.CacheStore(Path(tmp))
+            for status, expected in ((304, True), (503, False)):
+                resp = FakeResponse(status)
+                with mock.patch.object(local_updater, "STORE", store), \
+                        mock.patch.object(store, "is_current", return_value=True), \
+                        mock.patch.object(local_updater.SESSION, "get", return_value=resp):
+                    self.assertEqual(local_updater.fetch_and_save("SMBC", "https://example.com"), expected)
+                self.assertTrue(resp.closed)
+                self.assertEqual(resp.read, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import preflight
+import scraper
+from fake_http import FakeResponse
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+
+class PreflightTests(unittest.TestCase):
+    def test_import_does_not_load_heavy_dependencies(self):
+        code = "import sys, preflight; print(sorted(m for m in ('google.genai', 'trafilatura') if m in sys.modules))"
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+
+        self.assertEqual(output.stdout.strip(), "[]")
+
+    def test_reports_every_card_for_live_and_cache(self):
+        def fake_get(session, url, headers=None, timeout=None, **kwargs):
+            # SMBC だけ取得に失敗させ、キャッシュに切り替わることを確かめる
+            if "smbc" in url:
+                return FakeResponse(503, b"")
+            return FakeResponse(200, (ROOT_DIR / "html_cache" / "MUFG.html").read_bytes(), {"content-type": "text/html; charset=UTF-8"})
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(scraper, "CACHE_DIR", Path(shutil.copytree(ROOT_DIR / "html_cache", Path(tmp) / "html_cache"))), \
+                mock.patch.object(scraper, "polite_get", side_effect=fake_get), \
+                mock.patch.object(scraper, "clean_html_aggressive", side_effect=AssertionError("heavy cleaner used")):
+            report = preflight.run_preflight()
+
+        results = {(result["card"], result["mode"]): result for result in report["results"]}
+        self.assertEqual(set(results), {(card, mode) for card in scraper.URLS for mode in preflight.MODES})
+        self.assertTrue(report["ok"])
+        self.assertEqual(results[("SMBC", "live")]["source"], "cache")
+        self.assertEqual(results[("MUFG", "live")]["source"], "direct")
+        self.assertEqual(results[("MUFG", "cache")]["source"], "cache")
+
+
+if __name__ == "__main__":
+    unittest.main()
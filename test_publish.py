@@ -0,0 +1,85 @@
+import gzip
+import json
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+import publish as publish_module
+from publish import compact_payload, expand_payload, publish
+from search_index import stores_hash
+
+
+OUTPUT = {
+    "meta": {"smbc_url": "https://example.com/smbc"},
+    "stores": [
+        {
+            "name": name,
+            "group": None,
+            "aliases": [name.lower()],
+            "conditions": {"payment_method": "スマホタッチ決済のみ", "mobile_order": "対象外", "delivery": "対象外", "note": note},
+            "official_list_url": None,
+            "card_type": card,
+            "source_url": f"https://example.com/{card}",
+        }
+        for name, card, note in (("Seven", "SMBC", "商業施設内は対象外"), ("Lawson", "MUFG", None), ("Gusto", "SMBC", "個別"))
+    ],
+}
+PUBLISHED = {**OUTPUT, "stores_hash": stores_hash(OUTPUT["stores"])}
+
+
+class PublishTests(unittest.TestCase):
+    def test_compact_payload_round_trips(self):
+        payload = compact_payload(OUTPUT)
+
+        self.assertIn("対象外", payload["strings"])
+        self.assertNotIn("個別", payload["strings"])
+        self.assertEqual(expand_payload(json.loads(json.dumps(payload))), OUTPUT)
+
+    def test_compact_payload_round_trips_real_data_and_unknown_keys(self):
+        real = json.loads((ROOT_DIR / "data.json").read_text(encoding="utf-8"))
+        odd = {
+            "meta": {},
+            "stores": [
+                {"name": "A", "conditions": {"note": 3}},
+                {"name": "B", "rank": 2.5, "extra": {"k": [1]}, "conditions": ["x"], "group": True},
+                {"name": "C", "conditions": None},
+                {"name": "D"},
+            ],
+        }
+
+        for output in (real, odd):
+            payload = json.loads(json.dumps(compact_payload(output)))
+            self.assertEqual(expand_payload(payload), output)
+
+    def test_publish_writes_compatible_and_compressed_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            publish(OUTPUT, root / "data.json", root / "search_index.json", shards=True)
+
+            self.assertEqual(json.loads((root / "data.json").read_text(encoding="utf-8")), PUBLISHED)
+            compact = (root / "data.min.json").read_bytes()
+            self.assertEqual(gzip.decompress((root / "data.min.json.gz").read_bytes()), compact)
+            self.assertEqual(expand_payload(json.loads(compact)), PUBLISHED)
+            index = json.loads((root / "search_index.json").read_text(encoding="utf-8"))
+            self.assertEqual(index["stores_hash"], PUBLISHED["stores_hash"])
+            shard = json.loads((root / "data" / "MUFG.min.json").read_text(encoding="utf-8"))
+            self.assertEqual([store["name"] for store in expand_payload(shard)["stores"]], ["Lawson"])
+
+    def test_publish_removes_stale_compact_file_when_round_trip_fails(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            publish(OUTPUT, root / "data.json", root / "search_index.json")
+            lossy = lambda output: compact_payload({"meta": output["meta"], "stores": output["stores"][:1]})
+            with mock.patch.object(publish_module, "compact_payload", side_effect=lossy):
+                publish(OUTPUT, root / "data.json", root / "search_index.json")
+
+            self.assertFalse((root / "data.min.json").exists())
+            self.assertFalse((root / "data.min.json.gz").exists())
+            self.assertEqual(json.loads((root / "data.json").read_text(encoding="utf-8")), PUBLISHED)
+
+
+if __name__ == "__main__":
+    unittest.main()
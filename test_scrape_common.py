@@ -1,6 +1,34 @@
+import time
 import unittest
+from pathlib import Path
 
-from scrape_common import decode_bytes, is_useful_content, repair_mojibake
+from cleaners import clean_extract_text
+from scrape_common import FetchAborted, SourceDocument, declared_encoding, decode_bytes, is_useful_content, normalize_search_text, polite_get, read_body, repair_mojibake, text_stats
+
+
+class RecordingSession:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append((url, time.monotonic()))
+        return url
+
+
+class StreamingResponse:
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {"content-type": "text/html"}
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
 
 
 class ScrapeCommonTests(unittest.TestCase):
@@ -17,6 +45,23 @@ class ScrapeCommonTests(unittest.TestCase):
         self.assertIn("三菱UFJ", decoded)
         self.assertIn("対象店舗", decoded)
 
+    def test_decodes_cp932_without_declaration(self):
+        text = "<html><body>三菱UFJ 対象店舗 セブン-イレブン ～ 最大20％還元</body></html>"
+
+        self.assertEqual(decode_bytes(text.encode("cp932"), {"content-type": "text/html"}), text)
+
+    def test_reads_meta_charset_declaration(self):
+        html = b'<html><head><meta charset="Shift_JIS"></head><body></body></html>'
+
+        self.assertEqual(declared_encoding(html, {"content-type": "text/html"}), "Shift_JIS")
+        self.assertEqual(declared_encoding(html, {"content-type": "text/html; charset=euc-jp"}), "euc-jp")
+
+    def test_repairs_mojibake_bytes(self):
+        original = "対象店舗で最大20％ポイント還元｜三菱UFJカード セブン-イレブン"
+        broken = original.encode("utf-8").decode("latin-1").encode("utf-8")
+
+        self.assertEqual(decode_bytes(broken), original)
+
     def test_rejects_non_official_content(self):
         self.assertFalse(is_useful_content("MUFG", "Access Denied" * 100))
 
@@ -25,6 +70,74 @@ class ScrapeCommonTests(unittest.TestCase):
 
         self.assertTrue(is_useful_content("MUFG", html))
 
+    def test_text_stats_counts_once_per_text(self):
+        text = "三菱UFJ 対象店舗 セブン ã\u00e2\u0080 abc"
+        stats = text_stats(text)
+
+        self.assertEqual(stats.japanese, 9)
+        self.assertEqual(stats.mojibake, 2)
+        self.assertEqual(stats.markers, {"三菱UFJ", "対象店舗", "セブン"})
+        # 同じ文字列は集計を使い回す
+        self.assertIs(text_stats(text), stats)
+
+    def test_read_body_keeps_official_pages(self):
+        raw = (Path(__file__).resolve().parent / "html_cache" / "MUFG.html").read_bytes()
+        response = StreamingResponse([raw[i:i + 4096] for i in range(0, len(raw), 4096)])
+
+        self.assertEqual(read_body(response), raw)
+        self.assertEqual(response._content, raw)
+        self.assertTrue(response.closed)
+
+    def test_read_body_stops_at_block_pages_and_size_cap(self):
+        blocked = StreamingResponse([b"<html><head><title>Access Denied</title>" + b" " * 20000] + [b"x" * 4096] * 100)
+        with self.assertRaisesRegex(FetchAborted, "block page"):
+            read_body(blocked)
+        self.assertEqual(blocked.read, 1)
+        self.assertTrue(blocked.closed)
+
+        with self.assertRaisesRegex(FetchAborted, "exceeded"):
+            read_body(StreamingResponse([b"a" * 600] * 10), max_bytes=5000)
+        with self.assertRaisesRegex(FetchAborted, "content type"):
+            read_body(StreamingResponse([b"%PDF"], {"content-type": "application/pdf"}))
+
+    def test_read_body_keeps_pages_whose_markers_are_split_across_inline_elements(self):
+        # クリーナーがインライン要素をつなげて初めてマーカー（三菱UFJ）が現れるページも、読み込みでは落とさない
+        page = (
+            "<html><body><article><h1><span>三菱</span><span>UFJ</span>カード</h1><p>対象店舗 セブン</p>"
+            "<p>" + "説明文" * 300 + "</p></article></body></html>"
+        ).encode("utf-8")
+
+        self.assertEqual(read_body(StreamingResponse([page])), page)
+        self.assertTrue(is_useful_content("MUFG", clean_extract_text(page.decode("utf-8"), "MUFG")))
+
+    def test_normalizes_like_front_end_search(self):
+        self.assertEqual(normalize_search_text("マクドナルド McDonald's"), "まくどなるどmcdonalds")
+        self.assertEqual(normalize_search_text("ｾﾌﾞﾝ－イレブン"), "せぶんいれぶん")
+
+    def test_polite_get_spaces_requests_per_host(self):
+        session = RecordingSession()
+        polite_get(session, "https://polite.example/a", min_interval=0.05)
+        polite_get(session, "https://polite.example/b", min_interval=0.05)
+        polite_get(session, "https://other.example/", min_interval=0.05)
+
+        (_, first), (_, second), (_, other) = session.calls
+        self.assertGreaterEqual(second - first, 0.05)
+        self.assertLess(other - second, 0.05)
+
+    def test_source_document_cleans_once(self):
+        calls = []
+
+        def cleaner(text, card_name):
+            calls.append(card_name)
+            return text
+
+        html = "三菱UFJ 対象店舗 セブン " + ("説明文" * 300)
+        document = SourceDocument("MUFG", raw=html.encode("utf-8"), cleaner=cleaner)
+
+        self.assertTrue(document.useful)
+        self.assertEqual(document.cleaned, html)
+        self.assertEqual(calls, ["MUFG"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,494 @@
+import cProfile
+import json
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import scrape_common
+import scraper
+from batching import RequestBatcher
+from fake_http import FakeResponse
+from history import HistoryStore
+
+
+def sample_content(lines=400, changed=None):
+    rows = []
+    for i in range(lines):
+        text = f"店舗{i} 対象店舗 スマホのタッチ決済で最大7％還元 条件その{i}"
+        if i == changed:
+            text += " 変更あり"
+        rows.append(text)
+    return "\n".join(rows) + "\n"
+
+
+class SectionTests(unittest.TestCase):
+    def test_sections_cover_content(self):
+        content = sample_content()
+        sections = scraper.split_sections(content)
+
+        self.assertGreater(len(sections), 1)
+        self.assertEqual("".join(sections), content)
+        self.assertTrue(all(len(section) <= scraper.SECTION_MAX_CHARS for section in sections))
+
+    def test_local_edit_changes_only_nearby_sections(self):
+        before = scraper.split_sections(sample_content())
+        after = scraper.split_sections(sample_content(changed=350))
+
+        self.assertEqual(before[0], after[0])
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+
+    def test_long_lines_are_split_within_limit(self):
+        content = "".join(f"店舗{i}は対象です。" for i in range(3000)) + "\n"
+        sections = scraper.split_sections(content)
+
+        self.assertGreater(len(sections), 1)
+        self.assertEqual("".join(sections), content)
+        self.assertTrue(all(len(section) <= scraper.SECTION_MAX_CHARS for section in sections))
+        self.assertTrue(all(section.endswith(("。", "\n")) for section in sections))
+
+    def test_chunks_overlap_previous_section_tail(self):
+        sections = scraper.split_sections(sample_content())
+        chunks = scraper.section_chunks(sections)
+
+        self.assertEqual(chunks[0], sections[0])
+        for previous, section, chunk in zip(sections, sections[1:], chunks[1:]):
+            overlap = chunk[:-len(section)]
+            self.assertTrue(chunk.endswith(section))
+            self.assertTrue(previous.endswith(overlap))
+            self.assertLessEqual(len(overlap), scraper.SECTION_OVERLAP_CHARS)
+            self.assertTrue(overlap)
+
+    def test_page_notes_are_prepended_to_every_chunk(self):
+        content = sample_content() + "※商業施設内の店舗は対象外です\n"
+        sections = scraper.split_sections(content)
+        chunks = scraper.section_chunks(sections, scraper.page_context(content))
+
+        self.assertEqual(scraper.page_context(content), "※商業施設内の店舗は対象外です")
+        self.assertGreater(len(chunks), 1)
+        for section, chunk in zip(sections, chunks):
+            self.assertTrue(chunk.startswith("[Page-wide notes (apply to every store)]\n※商業施設内の店舗は対象外です\n"))
+            self.assertTrue(chunk.endswith(section))
+        self.assertEqual(scraper.section_chunks(sections[:1], "※注記"), sections[:1])
+
+    def test_merge_fills_missing_fields_from_duplicates(self):
+        merged = scraper.merge_section_stores([
+            [{"name": "吉野家", "aliases": ["よしのや"], "official_list_url": None, "conditions": {"note": ""}}],
+            [{"name": "吉野家", "aliases": ["吉牛", "よしのや"], "official_list_url": "https://example.com/list",
+              "conditions": {"note": "商業施設内は対象外"}}],
+        ])
+
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0]["aliases"], ["よしのや", "吉牛"])
+        self.assertEqual(merged[0]["official_list_url"], "https://example.com/list")
+        self.assertEqual(merged[0]["conditions"]["note"], "商業施設内は対象外")
+
+    def test_merge_drops_duplicate_stores(self):
+        merged = scraper.merge_section_stores([
+            [{"name": "セブン-イレブン", "aliases": ["セブン"]}],
+            [{"name": "セブン－イレブン"}, {"name": "ローソン"}, {"group": "no name"}],
+        ])
+
+        self.assertEqual([item["name"] for item in merged], ["セブン-イレブン", "ローソン"])
+
+
+class IncrementalExtractionTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        patched = (
+            ("ROOT_DIR", root),
+            ("CACHE_DIR", root / "html_cache"),
+            ("EXTRACT_CACHE_FILE", root / "extract_cache.json"),
+            ("DATA_FILE", root / "data.json"),
+        )
+        for name, value in patched:
+            patcher = mock.patch.object(scraper, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_extract(self, content, request, previous_index=None):
+        document = scrape_common.SourceDocument("SMBC", text=content, cleaner=lambda text, card: text)
+        with mock.patch.object(scraper, "get_source_html", return_value=(document, "cache")), \
+                mock.patch.object(scraper, "request_store_items", side_effect=request) as requested:
+            items = scraper.fetch_and_extract("SMBC", "https://example.com", previous_index)
+        return items, requested.call_count
+
+    def test_only_changed_sections_are_requested(self):
+        counter = iter(range(1000))
+        request = lambda card, prompt, label: ([{"name": f"store{next(counter)}"}], None)
+
+        first, first_calls = self.run_extract(sample_content(), request)
+        same, same_calls = self.run_extract(sample_content(), request)
+        _, changed_calls = self.run_extract(sample_content(changed=350), request)
+
+        self.assertEqual(len(first), first_calls)
+        self.assertEqual(same, first)
+        self.assertEqual(same_calls, 0)
+        self.assertGreaterEqual(changed_calls, 1)
+        self.assertLessEqual(changed_calls, 2)
+
+    def test_extraction_cache_hit_and_miss(self):
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+
+        first, first_calls = self.run_extract(sample_content(), request)
+        hit, hit_calls = self.run_extract(sample_content(), request)
+        _, miss_calls = self.run_extract(sample_content(lines=200), request)
+
+        self.assertGreater(first_calls, 0)
+        self.assertEqual(hit, first)
+        self.assertEqual(hit_calls, 0)
+        self.assertGreater(miss_calls, 0)
+
+    def test_model_or_prompt_version_change_invalidates_cache(self):
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        _, first_calls = self.run_extract(sample_content(), request)
+
+        for name, value in (("MODEL_ID", "another-model"), ("PROMPT_VERSION", "another-prompt")):
+            with mock.patch.object(scraper, name, value):
+                _, calls = self.run_extract(sample_content(), request)
+            self.assertEqual(calls, first_calls, name)
+
+    def test_corrupt_cache_file_is_ignored_and_rewritten(self):
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        scraper.EXTRACT_CACHE_FILE.write_text('{"SMBC": ', encoding="utf-8")
+
+        items, calls = self.run_extract(sample_content(), request)
+
+        self.assertEqual(len(items), calls)
+        cache = json.loads(scraper.EXTRACT_CACHE_FILE.read_text(encoding="utf-8"))
+        self.assertEqual(cache["SMBC"]["stores"], items)
+
+    def test_failed_section_keeps_successful_sections_for_next_run(self):
+        def flaky(card, prompt, label):
+            if label == "SMBC_2":
+                return None, "Gemini request failed after retries"
+            return [{"name": f"store {label}"}], None
+
+        previous_index = scraper.index_previous_stores({"stores": [
+            {"name": "store SMBC_1", "card_type": "SMBC"},
+            {"name": "previous store", "card_type": "SMBC"},
+            {"name": "other card store", "card_type": "MUFG"},
+        ]})
+        failed, failed_calls = self.run_extract(sample_content(), flaky, previous_index)
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        retried, retried_calls = self.run_extract(sample_content(), request)
+
+        # 失敗したセクションの分は前回の店舗で埋める
+        names = [item["name"] for item in failed]
+        self.assertEqual(names[-1], "previous store")
+        self.assertEqual(len(names), failed_calls)
+        self.assertNotIn("store SMBC_2", names)
+        self.assertGreater(failed_calls, 2)
+        self.assertEqual(retried_calls, 1)
+        self.assertEqual(len(retried), failed_calls)
+
+    def test_partial_section_is_used_but_not_cached(self):
+        def partial(card, prompt, label):
+            error = "partial response: interrupted" if label == "SMBC_1" else None
+            return [{"name": f"store {label}"}], error
+
+        first, first_calls = self.run_extract(sample_content(), partial)
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        _, retried_calls = self.run_extract(sample_content(), request)
+
+        self.assertEqual(len(first), first_calls)
+        self.assertEqual(retried_calls, 1)
+
+    def test_not_modified_response_skips_cleaning_and_extraction(self):
+        content = sample_content()
+        html = content.encode("utf-8")
+        responses = [
+            FakeResponse(200, html, {"ETag": '"v1"'}),
+            FakeResponse(304, b"", {}),
+        ]
+        sent_headers = []
+
+        def fake_get(session, url, headers=None, timeout=None, **kwargs):
+            sent_headers.append(headers)
+            return responses.pop(0)
+
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        with mock.patch.object(scraper, "polite_get", side_effect=fake_get), \
+                mock.patch.object(scraper, "clean_html_aggressive", side_effect=lambda text, card="": text) as cleaner, \
+                mock.patch.object(scrape_common, "is_useful_content", return_value=True), \
+                mock.patch.object(scraper, "request_store_items", side_effect=request):
+            first = scraper.fetch_and_extract("SMBC", "https://example.com")
+            second = scraper.fetch_and_extract("SMBC", "https://example.com")
+
+        self.assertEqual(first, second)
+        self.assertNotIn("If-None-Match", sent_headers[0])
+        self.assertEqual(sent_headers[1]["If-None-Match"], '"v1"')
+        self.assertEqual(cleaner.call_count, 1)
+
+    def test_cleaner_change_forces_reextraction_despite_not_modified(self):
+        html = sample_content().encode("utf-8")
+        sent_headers = []
+
+        def fake_get(session, url, headers=None, timeout=None, **kwargs):
+            sent_headers.append(headers)
+            if "If-None-Match" in headers:
+                return FakeResponse(304, b"", {})
+            return FakeResponse(200, html, {"ETag": '"v1"'})
+
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        with mock.patch.object(scraper, "polite_get", side_effect=fake_get), \
+                mock.patch.object(scrape_common, "is_useful_content", return_value=True), \
+                mock.patch.object(scraper, "request_store_items", side_effect=request) as requested:
+            with mock.patch.object(scraper, "clean_html_aggressive", side_effect=lambda text, card="": text):
+                scraper.fetch_and_extract("SMBC", "https://example.com")
+            first_calls = requested.call_count
+            with mock.patch.object(scraper, "clean_html_aggressive", side_effect=lambda text, card="": "新しいクリーナー\n" + text), \
+                    mock.patch.object(scraper, "extract_cleaner_id", return_value="99:new-selector"):
+                scraper.fetch_and_extract("SMBC", "https://example.com")
+
+        self.assertNotIn("If-None-Match", sent_headers[1])
+        self.assertGreater(requested.call_count, first_calls)
+
+    def test_unchanged_body_without_validators_skips_decoding(self):
+        html = sample_content().encode("utf-8")
+        fake_get = lambda session, url, headers=None, timeout=None, **kwargs: FakeResponse(200, html, {})
+        request = lambda card, prompt, label: ([{"name": f"store {label}"}], None)
+        from_response = scraper.SourceDocument.from_response
+        with mock.patch.object(scraper, "polite_get", side_effect=fake_get), \
+                mock.patch.object(scraper, "clean_html_aggressive", side_effect=lambda text, card="": text), \
+                mock.patch.object(scrape_common, "is_useful_content", return_value=True), \
+                mock.patch.object(scraper.SourceDocument, "from_response", side_effect=from_response) as built, \
+                mock.patch.object(scraper, "request_store_items", side_effect=request) as requested:
+            first = scraper.fetch_and_extract("SMBC", "https://example.com")
+            second = scraper.fetch_and_extract("SMBC", "https://example.com")
+
+        self.assertEqual(first, second)
+        self.assertEqual(built.call_count, 1)
+        self.assertEqual(requested.call_count, len(first))
+
+
+class PreviousDataTests(unittest.TestCase):
+    def setUp(self):
+        self.previous_index = scraper.index_previous_stores({"stores": [
+            {"name": "ガスト", "card_type": "SMBC", "aliases": ["がすと"], "official_list_url": "https://example.com/gusto",
+             "conditions": {"note": "商業施設内は対象外"}},
+            {"name": "吉野家", "card_type": "SMBC", "aliases": ["よしのや"], "conditions": {"note": ""}},
+            {"name": "ガスト", "card_type": "MUFG", "aliases": ["MUFG only"]},
+        ]})
+
+    def test_missing_fields_are_carried_over_per_card(self):
+        items = scraper.carry_over_previous("SMBC", [
+            {"name": "ｶﾞｽﾄ", "aliases": [], "official_list_url": None},
+            {"name": "吉野家", "aliases": ["吉牛"], "official_list_url": None},
+        ], self.previous_index)
+
+        self.assertEqual(items[0]["aliases"], ["がすと"])
+        self.assertEqual(items[0]["official_list_url"], "https://example.com/gusto")
+        self.assertEqual(items[1]["aliases"], ["吉牛"])
+
+    def test_fallback_copies_only_that_card(self):
+        stores = scraper.fallback_items("MUFG", "test", self.previous_index)
+        stores[0]["card_type"] = "changed"
+
+        self.assertEqual([item["aliases"] for item in stores], [["MUFG only"]])
+        self.assertEqual(self.previous_index[("MUFG", "がすと", "")]["card_type"], "MUFG")
+
+    def test_change_summary_flags_additions_removals_and_changes(self):
+        summary = scraper.change_summary([
+            {"name": "ガスト", "card_type": "SMBC", "conditions": {"note": ""}},
+            {"name": "サイゼリヤ", "card_type": "SMBC", "conditions": {}},
+            {"name": "ガスト", "card_type": "MUFG"},
+        ], self.previous_index)
+
+        self.assertEqual(summary["SMBC"], {"added": ["サイゼリヤ"], "removed": ["吉野家"], "changed": ["ガスト"]})
+        self.assertEqual(summary["MUFG"], {"added": [], "removed": [], "changed": []})
+
+    def test_same_name_in_another_group_is_a_different_store(self):
+        # セクションの重複排除・前回との比較・履歴が同じ store_key を使う
+        stores = [
+            {"name": "スターバックス", "group": "駅ナカ", "card_type": "SMBC", "conditions": {"note": "一部対象外"}},
+            {"name": "スターバックス", "group": None, "card_type": "SMBC", "conditions": {"note": ""}},
+        ]
+        previous_index = scraper.index_previous_stores({"stores": stores})
+
+        self.assertEqual(len(scraper.merge_section_stores([stores])), 2)
+        self.assertEqual(len(previous_index), 2)
+        self.assertEqual(
+            scraper.change_summary(stores[1:], previous_index)["SMBC"],
+            {"added": [], "removed": ["スターバックス"], "changed": []},
+        )
+        with tempfile.TemporaryDirectory() as tmp, HistoryStore(Path(tmp) / "history.sqlite3") as history:
+            history.record_run({"meta": {}, "stores": stores})
+            self.assertEqual(history.snapshot()["stores"], stores)
+
+
+class StoreItemTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(scraper, "ROOT_DIR", Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, *chunks, error=None):
+        def generate_stream(prompt, model, config=None, label=""):
+            yield from chunks
+            if error:
+                raise error
+        return mock.patch.object(scraper, "generate_stream", side_effect=generate_stream)
+
+    def test_validate_fills_optional_fields(self):
+        item, reason = scraper.validate_store_item({"name": " ガスト ", "aliases": ["がすと", 1]})
+
+        self.assertIsNone(reason)
+        self.assertEqual(item["name"], "ガスト")
+        self.assertEqual(item["aliases"], ["がすと"])
+        self.assertIsNone(item["group"])
+        self.assertEqual(set(item["conditions"]), set(scraper.STORE_CONDITION_FIELDS))
+        self.assertIsNone(scraper.validate_store_item({"aliases": []})[0])
+        self.assertIsNone(scraper.validate_store_item({"name": "A", "conditions": "none"})[0])
+
+    def test_invalid_items_are_dropped_without_failing(self):
+        with self.stream('[{"name": "A"}, {"group": "x"},', ' {"name": "B"}]'):
+            items, error = scraper.request_store_items("SMBC", "prompt", "SMBC_1")
+
+        self.assertIsNone(error)
+        self.assertEqual([item["name"] for item in items], ["A", "B"])
+
+    def test_interrupted_stream_keeps_received_items(self):
+        with self.stream('[{"name": "A"}, {"name": "B"}, {"na', error=scraper.GeminiError("Gemini stream was interrupted")):
+            items, error = scraper.request_store_items("SMBC", "prompt", "SMBC_1")
+
+        self.assertEqual([item["name"] for item in items], ["A", "B"])
+        self.assertIn("interrupted", error)
+
+    def test_stream_ending_before_closing_bracket_is_reported(self):
+        with self.stream('[{"name": "A"}, {"name": "B"}'):
+            items, error = scraper.request_store_items("SMBC", "prompt", "SMBC_1")
+
+        self.assertEqual([item["name"] for item in items], ["A", "B"])
+        self.assertEqual(error, "partial response: response ended before the closing bracket")
+
+    def test_response_without_items_fails(self):
+        with self.stream("抽出できませんでした"):
+            items, error = scraper.request_store_items("SMBC", "prompt", "SMBC_1")
+
+        self.assertIsNone(items)
+        self.assertEqual(error, "Gemini response was not valid JSON")
+
+
+class BatchExtractionTests(unittest.TestCase):
+    def test_cards_share_one_request_and_unanswered_tasks_fall_back(self):
+        answer = {"SMBC_1": [{"name": "ガスト", "aliases": []}, {"aliases": []}], "SMBC_catch": {"catch": "最大10%"}}
+        response = mock.Mock(text=json.dumps(answer, ensure_ascii=False))
+        single = lambda card, prompt, label: ([{"name": f"single {label}"}], None)
+        with mock.patch.object(scraper, "_batcher", RequestBatcher(scraper.request_batch, window=0.05)), \
+                mock.patch.object(scraper, "generate", return_value=response) as generate, \
+                mock.patch.object(scraper, "request_store_items", side_effect=single) as requested:
+            catch = scraper.request_catchphrase("SMBC", "紹介特典" * 20)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                smbc = executor.submit(scraper.extract_items, "SMBC", "SMBC本文", "SMBC_1")
+                mufg = executor.submit(scraper.extract_items, "MUFG", "MUFG本文", "MUFG_1")
+            self.assertEqual(catch(), "最大10%")
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertIn("=== TASK MUFG_1 (stores, MUFG) ===\nMUFG本文", generate.call_args[0][0])
+        smbc_items, smbc_error = smbc.result()
+        self.assertEqual([item["name"] for item in smbc_items], ["ガスト"])
+        self.assertIsNone(smbc_error)
+        # 答えのなかった MUFG だけ単独で依頼し直す
+        self.assertEqual(mufg.result(), ([{"name": "single MUFG_1"}], None))
+        self.assertEqual(requested.call_args[0][2], "MUFG_1")
+
+    def test_failed_batch_falls_back_to_single_requests(self):
+        single = lambda card, prompt, label: ([{"name": f"single {label}"}], None)
+        with mock.patch.object(scraper, "_batcher", RequestBatcher(scraper.request_batch, window=0.05)), \
+                mock.patch.object(scraper, "generate", side_effect=scraper.GeminiError("quota")), \
+                mock.patch.object(scraper, "request_store_items", side_effect=single) as requested:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(scraper.extract_items, ["SMBC", "MUFG"], ["a", "b"], ["SMBC_1", "MUFG_1"]))
+
+        self.assertEqual([items[0]["name"] for items, _ in results], ["single SMBC_1", "single MUFG_1"])
+        self.assertEqual(requested.call_count, 2)
+
+
+class ConcurrentPipelineTests(unittest.TestCase):
+    def test_main_merges_cards_in_registry_order(self):
+        def process(card, url, previous_index):
+            # 先に登録されたカードほど遅く終わる
+            time.sleep(0.05 if card == "SMBC" else 0)
+            return [{"name": f"{card} store", "card_type": card}], {f"{card.lower()}_url": url}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            data_file = Path(tmp) / "data.json"
+            with mock.patch.object(scraper, "DATA_FILE", data_file), \
+                    mock.patch.object(scraper, "SEARCH_INDEX_FILE", Path(tmp) / "search_index.json"), \
+                    mock.patch.object(scraper, "LOG_DIR", Path(tmp) / "logs"), \
+                    mock.patch.object(scraper, "ALIAS_FILE", Path(tmp) / "aliases.json"), \
+                    mock.patch.object(scraper, "HISTORY_FILE", Path(tmp) / "history.sqlite3"), \
+                    mock.patch.object(scraper, "generate_aliases", return_value={"SMBC store": ["えすえむびーしー"]}), \
+                    mock.patch.object(scraper, "process_card", side_effect=process):
+                scraper.main()
+            output = json.loads(data_file.read_text(encoding="utf-8"))
+            with HistoryStore(Path(tmp) / "history.sqlite3") as history:
+                snapshot = history.snapshot()
+            report_lines = next((Path(tmp) / "logs").glob("run_*.jsonl")).read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual([item["card_type"] for item in output["stores"]], list(scraper.URLS))
+        self.assertEqual(output["stores"][0]["aliases"], ["えすえむびーしー"])
+        self.assertEqual(set(output["meta"]), {f"{card.lower()}_url" for card in scraper.URLS})
+        report = json.loads(report_lines[0])
+        self.assertEqual(report["type"], "run")
+        self.assertIn("write", report["stages"])
+        self.assertEqual(report["changes"]["SMBC"]["added"], ["SMBC store"])
+        self.assertEqual(snapshot, output)
+
+    def test_main_profile_keeps_every_card_pipeline(self):
+        def source(card, url, known_hash=None):
+            document = scrape_common.SourceDocument(card, text=sample_content(20), cleaner=lambda text, card: text)
+            document.useful = True
+            return document, "direct"
+
+        def request(card, prompt, label):
+            return [{"name": f"{card} store", "conditions": {}}], None
+
+        enable = cProfile.Profile.enable
+        active = []
+
+        def enable_once(profiler):
+            # 3.12 以降と同じく、2つ目のプロファイラは ValueError にする
+            if active:
+                raise ValueError("Another profiling tool is already active")
+            active.append(profiler)
+            enable(profiler)
+
+        # 3.12 以降（1つのプロファイラで全スレッド）と 3.11 以前（ワーカーごと）、
+        # 判定をすり抜けて2つ目のプロファイラが拒否された場合を通す
+        for covers_threads, enable_patch in ((True, enable), (False, enable), (False, enable_once)):
+            active.clear()
+            with self.subTest(covers_threads=covers_threads, enable=enable_patch.__name__), \
+                    tempfile.TemporaryDirectory() as tmp:
+                root = Path(tmp)
+                with mock.patch.object(scraper, "PROFILER_COVERS_THREADS", covers_threads), \
+                        mock.patch.object(cProfile.Profile, "enable", enable_patch), \
+                        mock.patch.object(scraper, "ROOT_DIR", root), \
+                        mock.patch.object(scraper, "DATA_FILE", root / "data.json"), \
+                        mock.patch.object(scraper, "SEARCH_INDEX_FILE", root / "search_index.json"), \
+                        mock.patch.object(scraper, "LOG_DIR", root / "logs"), \
+                        mock.patch.object(scraper, "ALIAS_FILE", root / "aliases.json"), \
+                        mock.patch.object(scraper, "HISTORY_FILE", root / "history.sqlite3"), \
+                        mock.patch.object(scraper, "EXTRACT_CACHE_FILE", root / "extract_cache.json"), \
+                        mock.patch.object(scraper, "REFERRAL_URLS", {}), \
+                        mock.patch.object(scraper, "get_source_html", side_effect=source), \
+                        mock.patch.object(scraper, "request_store_items", side_effect=request), \
+                        mock.patch.object(scraper, "generate_aliases", return_value={}), \
+                        mock.patch.object(scraper, "fallback_items", side_effect=AssertionError("fell back")):
+                    scraper.main(profile=True)
+                output = json.loads((root / "data.json").read_text(encoding="utf-8"))
+
+                self.assertEqual([item["name"] for item in output["stores"]], [f"{card} store" for card in scraper.URLS])
+                self.assertTrue(list((root / "logs").glob("profile_*.prof")))
+                self.assertIsNone(scraper._profilers)
+
+
+if __name__ == "__main__":
+    unittest.main()
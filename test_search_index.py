@@ -0,0 +1,59 @@
+import gzip
+import json
+import unittest
+from pathlib import Path
+
+from publish import compact_payload
+from search_index import build_search_index, search_keys, search_stores
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+
+STORES = [
+    {
+        "name": "マクドナルド",
+        "group": None,
+        "aliases": ["マック", "マクド", "McDonald's"],
+        "conditions": {"delivery": "マックデリバリーは対象外", "note": None},
+    },
+    {"name": "吉野家", "group": None, "aliases": ["よしのや", "吉牛"], "conditions": {}},
+    {"name": "ガスト", "group": "すかいらーくグループ", "aliases": [], "conditions": {"delivery": "対象外"}},
+]
+
+
+def linear_search(stores, raw_query):
+    queries = [key for part in raw_query.split() for key in search_keys({"name": part})]
+    return [
+        store_id
+        for store_id, store in enumerate(stores)
+        if queries and all(any(query in key for key in search_keys(store)) for query in queries)
+    ]
+
+
+class SearchIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = build_search_index(STORES)
+
+    def test_keys_are_normalized_like_front_end(self):
+        self.assertEqual(search_keys(STORES[0])[:3], ["まくどなるど", "まっく", "まくど"])
+        self.assertIn("mcdonalds", search_keys(STORES[0]))
+
+    def test_index_lookup_matches_linear_scan(self):
+        for query in ("マック", "ﾏｸﾄﾞ デリバリー", "吉", "すかいらーく 対象外", "対象外", "ローソン", "c"):
+            with self.subTest(query=query):
+                self.assertEqual(search_stores(self.index, query), linear_search(STORES, query))
+
+    def test_published_index_is_smaller_than_the_data_it_indexes(self):
+        # 転置インデックスは配信せず、読み込み時に keys から作る
+        self.assertNotIn("grams", self.index)
+        data = json.loads((ROOT_DIR / "data.json").read_text(encoding="utf-8"))
+        index = json.dumps(build_search_index(data["stores"]), ensure_ascii=False, separators=(",", ":"))
+        payload = json.dumps(compact_payload(data), ensure_ascii=False, separators=(",", ":"))
+        self.assertLess(len(gzip.compress(index.encode("utf-8"))), len(gzip.compress(payload.encode("utf-8"))))
+
+    def test_blank_query_matches_nothing(self):
+        self.assertEqual(search_stores(self.index, "  "), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from statement_matcher import Automaton, StoreMatcher, main, match_rows
+
+STORES = [
+    {"name": "セブン-イレブン", "group": None, "aliases": ["セブン", "セブイレ"], "card_type": "SMBC"},
+    {"name": "セブン-イレブン", "group": None, "aliases": ["セブン"], "card_type": "MUFG"},
+    {"name": "ガスト", "group": "すかいらーくグループ", "aliases": ["がすと"], "card_type": "SMBC"},
+    {"name": "バーミヤン", "group": "すかいらーくグループ", "aliases": [], "card_type": "SMBC"},
+    {"name": "吉野家", "group": None, "aliases": ["吉", "よしのや"], "card_type": "MUFG"},
+]
+
+
+class AutomatonTests(unittest.TestCase):
+    def test_reports_overlapping_and_nested_keys(self):
+        automaton = Automaton()
+        for key in ("he", "she", "his", "hers"):
+            automaton.add(key, key)
+        automaton.build()
+
+        self.assertEqual(list(automaton.matches("ushers")), [(4, "she"), (4, "he"), (6, "hers")])
+
+
+class StoreMatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.matcher = StoreMatcher(STORES, {"SMBC": 7.0, "MUFG": 10.0})
+
+    def test_statement_descriptors_are_folded_like_search(self):
+        result = self.matcher.match("ｾﾌﾞﾝｲﾚﾌﾞﾝ ｼﾝｼﾞﾕｸ 1234")
+
+        # 同じ店舗名なら還元率の高いカードを選ぶ
+        self.assertEqual(result, {"store": "セブン-イレブン", "card_type": "MUFG", "rate": 10.0, "matched": "セブン-イレブン"})
+
+    def test_longest_key_wins_and_name_beats_group(self):
+        self.assertEqual(self.matcher.match("ヨシノヤ 新宿店")["store"], "吉野家")
+        self.assertEqual(self.matcher.match("すかいらーくグループ ガスト")["store"], "ガスト")
+        self.assertEqual(self.matcher.match("すかいらーくグループ 店舗")["matched"], "すかいらーくグループ")
+        # 1文字の別名は照合に使わない
+        self.assertIsNone(self.matcher.match("吉田商店"))
+
+    def test_match_rows_appends_result_columns(self):
+        rows = csv.reader(io.StringIO("日付,利用店名,金額\n2024/05/01,ｶﾞｽﾄ 渋谷店,1200\n2024/05/02,AMAZON,980\n"))
+
+        output = list(match_rows(self.matcher, rows, "利用店名", has_header=True))
+
+        self.assertEqual(output[0], ["日付", "利用店名", "金額", "store", "card_type", "rate", "matched"])
+        self.assertEqual(output[1][3:], ["ガスト", "SMBC", 7.0, "ガスト"])
+        self.assertEqual(output[2][3:], ["", "", "", ""])
+
+
+class MainTests(unittest.TestCase):
+    def test_stdin_is_read_with_the_given_encoding(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data = Path(tmp) / "data.json"
+            data.write_text(json.dumps({"meta": {}, "stores": STORES}, ensure_ascii=False), encoding="utf-8")
+            for encoding, raw in (
+                ("cp932", "利用店名\nｶﾞｽﾄ 渋谷店\n".encode("cp932")),
+                ("utf-8-sig", "\ufeff利用店名\nｶﾞｽﾄ 渋谷店\n".encode("utf-8")),
+            ):
+                stdin = io.TextIOWrapper(io.BytesIO(raw), encoding="ascii")
+                stdout = io.StringIO()
+                with mock.patch("sys.stdin", stdin), mock.patch("sys.stdout", stdout):
+                    main(["--data", str(data), "--column", "利用店名", "--encoding", encoding])
+
+                self.assertEqual(stdout.getvalue().splitlines()[1], "ｶﾞｽﾄ 渋谷店,ガスト,SMBC,7.0,ガスト")
+                self.assertFalse(stdin.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()